@@ -0,0 +1,54 @@
+# Shared thread pool for the batch onion and proof-of-relay APIs.
+# Their per-item work is AEAD or signature crypto that releases the GIL, so
+# contiguous chunks of a batch spread across threads.
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+class ChunkedThreadPool:
+    """Maps a function over a batch in order, one contiguous chunk per worker.
+
+    Small batches run inline, and the executor is only started for the first
+    batch large enough to split.
+
+    Args:
+        max_workers: Thread pool size (None: ThreadPoolExecutor's default).
+        thread_name_prefix: Name prefix for the worker threads.
+    """
+    def __init__(self, max_workers=None, thread_name_prefix=""):
+        self.max_workers = max_workers
+        self.thread_name_prefix = thread_name_prefix
+        self._executor = None
+
+    @property
+    def workers(self):
+        return self.max_workers or min(32, (os.cpu_count() or 1) + 4)   # ThreadPoolExecutor's default
+
+    def map_chunks(self, function, items):
+        """Returns [function(item) for item in items], computed across the pool."""
+        workers = self.workers
+        if workers < 2 or len(items) < 2 * workers:
+            return [function(item) for item in items]
+        chunk_size = -(-len(items) // workers)
+        chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=self.thread_name_prefix)
+        results = []
+        for chunk_results in self._executor.map(lambda chunk: [function(item) for item in chunk], chunks):
+            results.extend(chunk_results)
+        return results
+
+    def close(self):
+        """Shuts down the executor, if one was started; a later batch starts a new one."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+# Example Usage:
+if __name__ == "__main__":
+    import hashlib
+
+    pool = ChunkedThreadPool(max_workers=4, thread_name_prefix="demo")
+    digests = pool.map_chunks(lambda data: hashlib.sha256(data).hexdigest()[:8], [bytes([i]) * 4096 for i in range(16)])
+    pool.close()
+    print(f"{len(digests)} digests in input order: {digests[:4]}...")
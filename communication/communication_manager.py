@@ -2,10 +2,15 @@
 # Main orchestration layer for the Cerberus communication system.
 
 from enum import Enum
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import time
 import random
 import threading
 
+import numpy as np
+
 # Assuming the other modules are in the same directory
 from communication.secure_5g_module import Secure5GModule
 from security.imsi_privacy import MockHSMService
@@ -29,23 +34,202 @@ class MockMeshModule:
     def get_status(self): return {"active": True, "signal": random.uniform(0.5, 1.0)}
 
 class MockSecurityFramework:
+    def __init__(self):
+        self._listeners = []
     def get_threat_level(self): return random.choice(["LOW", "MEDIUM", "HIGH"])
+    def add_listener(self, callback):
+        """callback(threat_level) is called on every reported threat level change."""
+        self._listeners.append(callback)
+    def report_threat(self, level):
+        # Called by the threat detectors (e.g. on a fake base station alert)
+        for callback in self._listeners:
+            callback(level)
 
 class MockMissionPlanner:
     def get_mission_requirements(self): return {"criticality": "HIGH"}
 
 # --- Predictive Connectivity ---
 class ConnectivityPredictor:
+    """Per-mode link quality forecasts from a fixed-size ring buffer of samples.
+
+    Each mode keeps the last `capacity` samples of (signal quality, latency ms,
+    loss rate) in NumPy ring buffers, together with the smoothed level and
+    trend after each sample. Levels and trends are updated incrementally with
+    Holt's linear-trend smoothing (or plain EWMA with model="ewma"), so a
+    forecast for every mode and metric is one vectorized level + trend * h.
+
+    Every new sample also scores the forecasts the predictor could have made
+    HORIZONS seconds earlier (from the stored level/trend snapshots), giving
+    running error statistics per mode, horizon and metric; trusted_horizon()
+    turns them into how far ahead a mode's forecasts can be relied on.
+
+    Args:
+        modes: Mode values to track.
+        capacity: Samples kept per mode.
+        alpha: Level smoothing factor.
+        beta: Trend smoothing factor (Holt only).
+        model: "holt" (level and trend) or "ewma" (level only).
+        horizons: Forecast horizons in seconds whose errors are tracked.
+        clock: Time source in seconds.
+    """
+    METRICS = ("signal", "latency_ms", "loss")
+    HORIZONS = (1.0, 5.0, 15.0, 30.0)
+    DEFAULTS = (0.5, 100.0, 0.05)   # Assumed before a mode has any samples
+
+    def __init__(self, modes=("mesh", "5g", "satellite"), capacity=512, alpha=0.2, beta=0.02, model="holt",
+                 horizons=HORIZONS, clock=time.monotonic):
+        if model not in ("holt", "ewma"):
+            raise ValueError(f"Unknown model {model!r}; expected 'holt' or 'ewma'")
+        self.modes = list(modes)
+        self._mode_index = {mode: i for i, mode in enumerate(self.modes)}
+        self.capacity = capacity
+        self.alpha = alpha
+        self.beta = beta if model == "holt" else 0.0
+        self.model = model
+        self.horizons = np.asarray(horizons, dtype=np.float64)
+        self.clock = clock
+        shape = (len(self.modes), capacity)
+        metrics = len(self.METRICS)
+        self._times = np.full(shape, -np.inf)
+        self._samples = np.zeros(shape + (metrics,))
+        self._levels = np.zeros(shape + (metrics,))
+        self._trends = np.zeros(shape + (metrics,))
+        self._head = [0] * len(self.modes)
+        self.counts = np.zeros(len(self.modes), dtype=np.int64)
+        self.level = np.tile(np.asarray(self.DEFAULTS, dtype=np.float64), (len(self.modes), 1))
+        self.trend = np.zeros((len(self.modes), metrics))
+        self.updated_at = np.zeros(len(self.modes))   # Trends are zero until a mode has samples
+        error_shape = (len(self.modes), len(self.horizons))
+        self._error_counts = np.zeros(error_shape)
+        self._error_sums = np.zeros(error_shape + (metrics,))
+        self._abs_error_sums = np.zeros(error_shape + (metrics,))
+        self._squared_error_sums = np.zeros(error_shape + (metrics,))
+        self._lower = np.zeros(metrics)
+        self._upper = np.array((1.0, np.inf, 1.0))   # signal and loss are fractions
+        self._lock = threading.Lock()
+
+    def record(self, mode, signal, latency_ms, loss, timestamp=None):
+        """Adds one link quality sample for a mode (a CommMode or its value)."""
+        i = self._mode_index[getattr(mode, "value", mode)]
+        t = self.clock() if timestamp is None else timestamp
+        y = np.array((signal, latency_ms, loss), dtype=np.float64)
+        with self._lock:
+            if self.counts[i]:
+                self._score_forecasts(i, t, y)
+                dt = t - self.updated_at[i]
+                predicted = self.level[i] + self.trend[i] * max(dt, 0.0)
+                level = self.alpha * y + (1 - self.alpha) * predicted
+                if dt > 1e-3:   # Samples taken at the same instant refine the level, not the trend
+                    self.trend[i] = self.beta * (level - self.level[i]) / dt + (1 - self.beta) * self.trend[i]
+                self.level[i] = level
+            else:
+                self.level[i] = y
+            self.updated_at[i] = t
+            head = self._head[i]
+            self._times[i, head] = t
+            self._samples[i, head] = y
+            self._levels[i, head] = self.level[i]
+            self._trends[i, head] = self.trend[i]
+            self._head[i] = (head + 1) % self.capacity
+            self.counts[i] += 1
+
+    def _score_forecasts(self, i, t, y):
+        # For each horizon h, the newest snapshot taken at least h seconds before t...
+        times = self._times[i]
+        issued = np.where(times[None, :] <= t - self.horizons[:, None], times[None, :], -np.inf)
+        slots = issued.argmax(axis=1)
+        issued_at = times[slots]
+        # ...counts only if there is one (argmax of all -inf is slot 0, which is too recent) and
+        # it is not much older, or it would be scoring a longer horizon.
+        valid = (issued_at <= t - self.horizons) & (t - issued_at <= self.horizons * 1.5)
+        if not valid.any():
+            return
+        forecast = self._levels[i, slots] + self._trends[i, slots] * (t - issued_at)[:, None]
+        error = np.where(valid[:, None], y - forecast, 0.0)
+        self._error_counts[i] += valid
+        self._error_sums[i] += error
+        self._abs_error_sums[i] += np.abs(error)
+        self._squared_error_sums[i] += error * error
+
+    def forecast(self, seconds_ahead=15):
+        """(modes, metrics) array of forecasts seconds_ahead from now; modes without samples get DEFAULTS."""
+        with self._lock:
+            values = self.level + self.trend * (self.clock() + seconds_ahead - self.updated_at)[:, None]
+        return np.clip(values, self._lower, self._upper, out=values)
+
     def predict_connectivity(self, seconds_ahead=15):
-        return {
-            "5g_signal": random.uniform(0.1, 0.9),
-            "mesh_density": random.uniform(0.2, 1.0)
-        }
+        """Forecast as a dict: "<mode>_signal", "<mode>_latency_ms" and "<mode>_loss" for every mode,
+        plus "mesh_density" (the mesh signal quality)."""
+        values = self.forecast(seconds_ahead)
+        prediction = {f"{mode}_{metric}": float(values[i, j])
+                      for i, mode in enumerate(self.modes) for j, metric in enumerate(self.METRICS)}
+        if "mesh" in self._mode_index:
+            prediction["mesh_density"] = prediction["mesh_signal"]
+        return prediction
+
+    def forecast_error_stats(self):
+        """Running forecast errors (observed - forecast) per mode, horizon and metric.
+
+        Returns a dict of "horizons" (H,), "samples" (modes, H) and "bias", "mae"
+        and "rmse" arrays of shape (modes, H, metrics); NaN where nothing was scored.
+        """
+        with self._lock:
+            counts = self._error_counts[:, :, None]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                return {
+                    "horizons": self.horizons.copy(),
+                    "samples": self._error_counts.copy(),
+                    "bias": self._error_sums / counts,
+                    "mae": self._abs_error_sums / counts,
+                    "rmse": np.sqrt(self._squared_error_sums / counts),
+                }
+
+    def trusted_horizon(self, mode, metric="signal", max_rmse=0.1, min_samples=10):
+        """Longest tracked horizon (seconds) up to which the mode's forecast RMSE stays within max_rmse; 0 if none."""
+        stats = self.forecast_error_stats()
+        i, j = self._mode_index[getattr(mode, "value", mode)], self.METRICS.index(metric)
+        ok = (stats["samples"][i] >= min_samples) & (stats["rmse"][i, :, j] <= max_rmse)
+        failing = np.flatnonzero(~ok)
+        trusted = ok if not failing.size else np.arange(len(ok)) < failing[0]
+        return float(self.horizons[trusted][-1]) if trusted.any() else 0.0
 
 # --- Mode Transition Controller ---
 class ModeTransitionController:
-    def __init__(self, comm_modules):
+    """Activates communication modules and switches traffic between them.
+
+    transition_async is make-before-break: the new module is activated on a
+    worker thread while the old one keeps carrying traffic, and active_mode
+    only moves to the new mode once it is up. Activation that misses its
+    mode's deadline, or whose transition is cancelled by a newer decision, is
+    abandoned; since a blocking activate() cannot be interrupted, the module
+    is deactivated when it eventually finishes unless it has been wanted again
+    in the meantime. Modules can also be prewarmed into standby, from which a
+    transition is a pointer swap.
+
+    Args:
+        comm_modules: Mode value -> module with activate()/deactivate().
+        deadlines: Per-mode activation deadlines in seconds, overriding ACTIVATION_DEADLINES.
+    """
+    ACTIVATION_DEADLINES = {"mesh": 2.0, "5g": 5.0, "satellite": 5.0, "emergency_beacon": 2.0}
+    COST_SMOOTHING = 0.3   # EWMA weight of the newest measured transition cost
+
+    def __init__(self, comm_modules, deadlines=None):
         self.comm_modules = comm_modules
+        self.deadlines = dict(self.ACTIVATION_DEADLINES, **(deadlines or {}))
+        self.active_mode = None     # The mode carrying traffic
+        self.pending_mode = None    # The mode transition_async is currently bringing up
+        self._activations = {}      # mode value -> concurrent Future of an in-flight activate()
+        self._teardowns = {}        # mode value -> asyncio Task taking a replaced link down
+        self.standby = set()        # Mode values that are up but not carrying traffic
+        self.wanted_standby = set() # Mode values a WarmStandbyPool wants kept up
+        self._executor = ThreadPoolExecutor(max_workers=len(comm_modules), thread_name_prefix="comm-activate")
+        self.transitions_completed = 0
+        self.transitions_cancelled = 0
+        self.deadline_misses = 0
+        self.standby_promotions = 0
+        self.switchover_times = deque(maxlen=1000)   # seconds from activation start to switch-over
+        self.transition_costs = {}   # (old mode value or None, new mode value) -> EWMA seconds until the old link is down
+        self.transition_time = 0.0   # Total seconds spent in transition_async, failed attempts included
 
     def transition_to(self, new_mode, current_mode):
         if new_mode == current_mode:
@@ -69,9 +253,406 @@ class ModeTransitionController:
         print(f"[TransitionController] Transition to {new_mode.value} successful.")
         return True
 
+    async def transition_async(self, new_mode, current_mode, on_switch_over=None):
+        """Brings new_mode up alongside current_mode and switches over once it is ready.
+
+        Returns True once traffic is on new_mode, False if activation failed or
+        missed its deadline (current_mode keeps carrying traffic). Raises
+        CancelledError if cancelled while activating, in which case the new link
+        is abandoned. on_switch_over(new_mode) is called the moment traffic moves;
+        taking the old link down afterwards runs in its own task, which
+        cancelling this coroutine does not interrupt.
+        """
+        if new_mode == current_mode:
+            return True
+        new_module = self.comm_modules.get(new_mode.value)
+        if not new_module:
+            print(f"  - ERROR: No module found for mode {new_mode.value}")
+            return False
+
+        started_at = time.monotonic()
+        switched = False
+        try:
+            if new_mode.value in self.standby:
+                # Warm standby: the link is already up, so switching is just a pointer swap.
+                print(f"\n[TransitionController] Promoting warm {new_mode.value} link...")
+                self.standby.discard(new_mode.value)
+                self.standby_promotions += 1
+            else:
+                print(f"\n[TransitionController] Bringing up {new_mode.value} while "
+                      f"{current_mode.value if current_mode else 'no link'} carries traffic...")
+                self.pending_mode = new_mode
+                try:
+                    activated = await self._await_activation(new_mode)
+                except asyncio.TimeoutError:
+                    self.deadline_misses += 1
+                    print(f"  - FAILURE: {new_mode.value} not ready within {self.deadlines[new_mode.value]:.1f} s. "
+                          f"Staying on {current_mode.value if current_mode else 'no link'}.")
+                    return False
+                except asyncio.CancelledError:
+                    self.transitions_cancelled += 1
+                    print(f"[TransitionController] Transition to {new_mode.value} superseded. Abandoning it.")
+                    raise
+                except Exception as error:
+                    activated = False
+                    print(f"  - ERROR: Activation of {new_mode.value} raised {error!r}")
+                finally:
+                    if self.pending_mode == new_mode:
+                        self.pending_mode = None
+                if not activated:
+                    print(f"  - FAILURE: Activation of {new_mode.value} failed. Aborting transition.")
+                    return False
+
+            # The new link is up: switch traffic over, then take the old link down (or keep it warm).
+            self.active_mode = new_mode
+            self.switchover_times.append(time.monotonic() - started_at)
+            self.transitions_completed += 1
+            print(f"[TransitionController] Switched over to {new_mode.value} "
+                  f"after {self.switchover_times[-1] * 1000:.0f} ms.")
+            switched = True
+            if on_switch_over is not None:
+                on_switch_over(new_mode)
+            teardown = asyncio.ensure_future(self._retire(current_mode, new_mode, started_at))
+            if current_mode is not None:
+                self._teardowns[current_mode.value] = teardown
+                teardown.add_done_callback(lambda task: self._teardowns.pop(current_mode.value, None)
+                                           if self._teardowns.get(current_mode.value) is task else None)
+            await asyncio.shield(teardown)
+            return True
+        finally:
+            if not switched:
+                self.transition_time += time.monotonic() - started_at
+
+    async def _retire(self, old_mode, new_mode, started_at):
+        """Keeps the replaced link warm or takes it down, then records what the whole transition cost."""
+        old_module = self.comm_modules.get(old_mode.value if old_mode else None)
+        if old_module and old_mode.value in self.wanted_standby:
+            self.standby.add(old_mode.value)
+        elif old_module and old_mode not in (self.active_mode, self.pending_mode):
+            await asyncio.get_running_loop().run_in_executor(self._executor, old_module.deactivate)
+        elapsed = time.monotonic() - started_at
+        self._record_cost(old_mode, new_mode, elapsed)
+        self.transition_time += elapsed
+
+    def _record_cost(self, old_mode, new_mode, seconds):
+        key = (old_mode.value if old_mode else None, new_mode.value)
+        previous = self.transition_costs.get(key)
+        self.transition_costs[key] = seconds if previous is None else previous + self.COST_SMOOTHING * (seconds - previous)
+
+    def transition_cost(self, old_mode, new_mode, default=1.0):
+        """Measured seconds to move traffic from old_mode to new_mode and take old_mode down.
+
+        A warm-standby target costs only the switch-over and teardown. Pairs not
+        measured yet cost default.
+        """
+        if old_mode is None or old_mode == new_mode:
+            return 0.0
+        return self.transition_costs.get((old_mode.value, new_mode.value), default)
+
+    def standby_snapshot(self):
+        """Mode values currently in standby, as a copy; call on the event loop."""
+        return frozenset(self.standby)
+
+    def is_activating(self, mode):
+        """True while an activate() for mode (a CommMode or its value) is in flight; call on the event loop."""
+        return getattr(mode, "value", mode) in self._activations
+
+    async def prewarm(self, mode):
+        """Activates mode without moving traffic to it, leaving it in standby. Returns True if it is up."""
+        if mode == self.active_mode or mode.value in self.standby:
+            return True
+        try:
+            activated = await self._await_activation(mode)
+        except asyncio.TimeoutError:
+            self.deadline_misses += 1
+            return False
+        if activated and mode not in (self.active_mode, self.pending_mode):
+            self.standby.add(mode.value)
+        return bool(activated)
+
+    async def demote(self, mode):
+        """Takes a standby link down."""
+        if mode.value not in self.standby:
+            return
+        self.standby.discard(mode.value)
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.comm_modules[mode.value].deactivate)
+
+    async def _await_activation(self, mode):
+        """Waits for mode's activate() on the worker pool, within its deadline.
+
+        Raises TimeoutError or CancelledError after abandoning the activation. Must run
+        on the event loop, which owns _activations and standby.
+        """
+        loop = asyncio.get_running_loop()
+        teardown = self._teardowns.get(mode.value)
+        if teardown is not None:
+            await asyncio.shield(teardown)   # Bring a link back only once its deactivate() has finished
+        activation = self._activations.get(mode.value)
+        if activation is None:
+            # An earlier, abandoned activation of the same module is reused rather than raced.
+            activation = self._activations[mode.value] = self._executor.submit(self.comm_modules[mode.value].activate)
+            activation.add_done_callback(lambda future: self._on_loop(loop, self._forget, mode, future))
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(activation)),
+                                          self.deadlines.get(mode.value))
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            activation.add_done_callback(lambda future: self._on_loop(loop, self._cleanup_abandoned, mode, future))
+            raise
+
+    @staticmethod
+    def _on_loop(loop, callback, *args):
+        """Runs callback on the event loop; done-callbacks of activations fire on worker threads."""
+        try:
+            loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            callback(*args)   # The loop has shut down, so nothing else touches the controller
+
+    def _forget(self, mode, activation):
+        if self._activations.get(mode.value) is activation:
+            del self._activations[mode.value]
+
+    def _cleanup_abandoned(self, mode, activation):
+        """Keeps or takes down a link whose activation finished after its transition gave up on it."""
+        if activation.cancelled() or activation.exception() is not None or not activation.result():
+            return
+        if mode in (self.active_mode, self.pending_mode) or mode.value in self.standby:
+            return
+        if mode.value in self.wanted_standby:
+            self.standby.add(mode.value)
+            return
+        print(f"[TransitionController] Abandoned {mode.value} link came up; taking it down.")
+        try:
+            self._executor.submit(self.comm_modules[mode.value].deactivate)
+        except RuntimeError:
+            self.comm_modules[mode.value].deactivate()   # Executor already shut down
+
+    async def drain(self):
+        """Waits for links still being taken down after a switch-over."""
+        while self._teardowns:
+            await asyncio.gather(*self._teardowns.values(), return_exceptions=True)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+# --- Warm Standby ---
+class WarmStandbyPool:
+    """Keeps the modes most likely to be needed next up but idle, within a power and bandwidth budget.
+
+    rebalance() takes modes ranked by how likely they are to be needed next
+    (from the connectivity forecast) and prewarms them greedily, best first,
+    while their standby costs fit the budget. A standby link no forecast has
+    ranked within budget for idle_timeout seconds is demoted, as is any link
+    needed to make room for a better-ranked one.
+
+    Args:
+        transition_controller: ModeTransitionController that owns the modules.
+        power_budget: Watts available for standby links.
+        bandwidth_budget: Keep-alive kbps available for standby links.
+        idle_timeout: Seconds an unwanted standby link is kept before demotion.
+    """
+    # Standby cost per mode: (watts, keep-alive kbps)
+    STANDBY_COSTS = {"mesh": (1.0, 8.0), "5g": (2.5, 16.0), "satellite": (8.0, 4.0)}
+
+    def __init__(self, transition_controller, power_budget=10.0, bandwidth_budget=32.0, idle_timeout=60.0,
+                 clock=time.monotonic):
+        self.controller = transition_controller
+        self.power_budget = power_budget
+        self.bandwidth_budget = bandwidth_budget
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self._last_wanted = {}   # mode value -> time it was last ranked within budget
+        self._tasks = set()
+        self.warmups = 0
+        self.demotions = 0
+
+    def _cost(self, values):
+        costs = [self.STANDBY_COSTS[value] for value in values]
+        return sum(power for power, _ in costs), sum(bandwidth for _, bandwidth in costs)
+
+    def rebalance(self, ranked_modes, in_use=None):
+        """Prewarms and demotes standby links for the given ranking; must be called on the event loop.
+
+        in_use is the mode selected to carry traffic, which needs no standby slot.
+        """
+        controller = self.controller
+        now = self.clock()
+        desired = []
+        for mode in ranked_modes:
+            value = mode.value
+            # The active mode may be ranked too: it is kept up as standby once traffic moves off it.
+            if mode == in_use or value in desired or value not in self.STANDBY_COSTS:
+                continue
+            power, bandwidth = self._cost(desired + [value])
+            if power <= self.power_budget and bandwidth <= self.bandwidth_budget:
+                desired.append(value)
+                self._last_wanted[value] = now
+        controller.wanted_standby = set(desired)
+
+        # Unwanted links keep their slot until idle_timeout, unless the wanted ones need the budget.
+        standby = controller.standby_snapshot()
+        kept = [value for value in standby if value not in desired and CommMode(value) != in_use]
+        kept.sort(key=lambda value: self._last_wanted.get(value, 0.0), reverse=True)
+        while kept:
+            power, bandwidth = self._cost(desired + kept)
+            if power <= self.power_budget and bandwidth <= self.bandwidth_budget:
+                break
+            self._demote(kept.pop())
+        for value in kept:
+            if now - self._last_wanted.get(value, 0.0) >= self.idle_timeout:
+                self._demote(value)
+
+        for value in desired:
+            mode = CommMode(value)
+            if mode not in (controller.active_mode, controller.pending_mode) and value not in standby \
+                    and not controller.is_activating(mode):
+                self.warmups += 1
+                print(f"[WarmStandby] Prewarming {value}.")
+                self._spawn(controller.prewarm(mode))
+
+    def _demote(self, value):
+        self.demotions += 1
+        print(f"[WarmStandby] Demoting unused {value} standby link.")
+        self._spawn(self.controller.demote(CommMode(value)))
+
+    def _spawn(self, coroutine):
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def drain(self):
+        """Waits for in-flight prewarm and demotion work."""
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+# --- Mode Selection ---
+class ModeSelectionPolicy:
+    """Hysteresis, minimum dwell times and transition costs on top of the memoryless selection rule.
+
+    The rule proposes a candidate mode together with its margin: how far the
+    deciding input (the forecast 5G signal) is past the rule's threshold. A
+    switch away from the target mode (the one carrying traffic or being
+    brought up) is held back while the target has been chosen for less than
+    its minimum dwell time, or while the margin is below hysteresis plus
+    cost_weight times the measured cost of that mode pair, so a switch that
+    re-authenticates a 5G link has to be worth more than a warm-standby
+    promotion. Mandatory switches (an override, a HIGH threat, no link at all)
+    are never held back.
+
+    Args:
+        transition_controller: ModeTransitionController whose measured transition costs are used; None uses default_cost.
+        hysteresis: Signal margin any switch must clear.
+        min_dwell: Per-mode seconds a chosen mode is kept, overriding MIN_DWELL.
+        cost_weight: Extra signal margin required per second of transition cost.
+        default_cost: Seconds assumed for a mode pair that has not been measured yet.
+        clock: Time source in seconds.
+    """
+    MIN_DWELL = {"mesh": 5.0, "5g": 10.0, "satellite": 10.0, "emergency_beacon": 0.0}
+
+    def __init__(self, transition_controller=None, hysteresis=0.05, min_dwell=None, cost_weight=0.02,
+                 default_cost=1.0, clock=time.monotonic):
+        self.controller = transition_controller
+        self.hysteresis = hysteresis
+        self.min_dwell = dict(self.MIN_DWELL, **(min_dwell or {}))
+        self.cost_weight = cost_weight
+        self.default_cost = default_cost
+        self.clock = clock
+        self.chosen = None        # The mode last switched to
+        self.chosen_at = None     # When it was chosen
+        self._held = None         # Candidate currently being held back
+        self.switches = 0
+        self.flaps_avoided = 0    # Proposed switches that were held back until the rule changed its mind
+        self.dwell_holds = 0      # Decisions held back by the dwell time
+        self.margin_holds = 0     # Decisions held back by hysteresis and transition cost
+
+    def transition_cost(self, old_mode, new_mode):
+        if old_mode is None or old_mode == new_mode:
+            return 0.0
+        if self.controller is None:
+            return self.default_cost
+        return self.controller.transition_cost(old_mode, new_mode, self.default_cost)
+
+    def required_margin(self, old_mode, new_mode):
+        """Signal margin a switch from old_mode to new_mode has to clear."""
+        return self.hysteresis + self.cost_weight * self.transition_cost(old_mode, new_mode)
+
+    def choose(self, target, candidate, margin, mandatory=False):
+        """Returns the mode to head for: candidate, or target if the switch is not worth it yet."""
+        if candidate == target:
+            if self._held is not None:
+                self.flaps_avoided += 1
+                self._held = None
+            return target
+        now = self.clock()
+        if target is not None and not mandatory:
+            # Dwell only counts from a switch this policy made; after a failed transition or a
+            # dropped link the entry time is unknown, so only the margin applies.
+            if target == self.chosen and now - self.chosen_at < self.min_dwell.get(target.value, 0.0):
+                self.dwell_holds += 1
+                self._held = candidate
+                return target
+            if margin < self.required_margin(target, candidate):
+                self.margin_holds += 1
+                self._held = candidate
+                return target
+        self._held = None
+        self.chosen = candidate
+        self.chosen_at = now
+        self.switches += 1
+        return candidate
+
 # --- Communication Manager ---
+THREAT = "threat"
+MISSION = "mission"
+CONNECTIVITY = "connectivity"
+LINK_SAMPLE = "link_sample"
+MODULE_STATUS = "module_status"
+OVERRIDE = "override"
+STOP = "stop"
+
+class CommEvent:
+    """A change pushed to the CommunicationManager by a threat source, the predictor or a module."""
+    __slots__ = ("kind", "value", "created_at")
+
+    def __init__(self, kind, value=None, created_at=None):
+        self.kind = kind
+        self.value = value
+        self.created_at = time.monotonic() if created_at is None else created_at
+
 class CommunicationManager:
-    def __init__(self):
+    """Event-driven mode selection on an asyncio loop.
+
+    Threat sources, the mission planner, the connectivity predictor and the
+    communication modules push events through post_event (safe from any
+    thread). The manager wakes on the first event, folds in whatever else
+    arrived within coalesce_window (none for urgent events such as a HIGH
+    threat), and decides once on the latest state. Transitions run as tasks
+    through ModeTransitionController.transition_async, so the old link keeps
+    carrying traffic and the loop keeps deciding while a module comes up; a
+    decision for a different mode cancels the pending transition.
+
+    Link samples reported through report_link_sample post a LINK_SAMPLE event,
+    at most one outstanding per mode, so a burst of samples becomes one fresh
+    forecast. The predictor feed only re-posts the forecast every
+    prediction_interval as a fallback, since trends keep moving the forecast
+    when samples stop arriving.
+
+    The selection rule itself is memoryless; selection_policy decides whether
+    its candidate is worth switching to, so noisy forecasts near a threshold do
+    not flip the link on every decision. After every decision the warm-standby
+    pool is rebalanced from a standby_horizon forecast, so the likely next mode
+    is already up when it is chosen.
+
+    Args:
+        coalesce_window: Seconds to wait for more events after a non-urgent one before deciding.
+        prediction_interval: Seconds between fallback connectivity predictions pushed by the predictor feed.
+        standby_horizon: How far ahead (seconds) the forecast used for warm standby looks.
+        standby_pool: WarmStandbyPool to use; None creates one with default budgets.
+        selection_policy: ModeSelectionPolicy to use; None creates one with default hysteresis and dwell times.
+    """
+    FIVE_G_SIGNAL_THRESHOLD = 0.5
+
+    def __init__(self, coalesce_window=0.02, prediction_interval=30.0, standby_horizon=15, standby_pool=None,
+                 selection_policy=None):
         self.hsm = MockHSMService()
         self.db = MockTrustedDB()
         self.comm_modules = {
@@ -84,57 +665,332 @@ class CommunicationManager:
         self.mission_planner = MockMissionPlanner()
         self.predictor = ConnectivityPredictor()
         self.transition_controller = ModeTransitionController(self.comm_modules)
-        
+        self.standby_pool = standby_pool or WarmStandbyPool(self.transition_controller)
+        self.selection_policy = selection_policy or ModeSelectionPolicy(self.transition_controller)
+        self.coalesce_window = coalesce_window
+        self.prediction_interval = prediction_interval
+        self.standby_horizon = standby_horizon
+
         self.current_mode = None
         self.is_running = False
+        # Latest known inputs, updated by events
+        self.threat_level = self.security_framework.get_threat_level()
+        self.mission = self.mission_planner.get_mission_requirements()
+        self.predicted_conn = self.predictor.predict_connectivity()
+        self.module_status = {}
+        self.forced_mode = None
+
+        self.security_framework.add_listener(lambda level: self.post_event(THREAT, level))
+        self._loop = None
+        self._events = None
+        self._ready = threading.Event()
+        self.decision_thread = None
+        self._transition = None         # asyncio.Task of the latest transition
+        self._activating_mode = None    # Mode that task is bringing up, until traffic switches over to it
+        self.events_received = 0
+        self.events_coalesced = 0
+        self.decisions = 0
+        self.reaction_times = deque(maxlen=1000)   # seconds from triggering event to transition start
+        self._samples_pending = set()   # Modes with a LINK_SAMPLE event not yet applied
+        self._sample_lock = threading.Lock()
+        self.samples_debounced = 0
 
     def start(self):
+        """Runs the manager's event loop on a background thread."""
         print("[CommManager] Starting...")
-        self.is_running = True
-        self.decision_thread = threading.Thread(target=self._decision_loop, daemon=True)
+        self.decision_thread = threading.Thread(target=asyncio.run, args=(self.run(),), daemon=True)
         self.decision_thread.start()
+        self._ready.wait()
 
     def stop(self):
         print("[CommManager] Stopping...")
-        self.is_running = False
         if self.decision_thread:
+            self.post_event(STOP)
             self.decision_thread.join()
+            self.decision_thread = None
+        self.transition_controller.close()
 
-    def _decision_loop(self):
-        while self.is_running:
-            print("\n--- [CommManager] Decision Cycle ---")
-            threat = self.security_framework.get_threat_level()
-            mission = self.mission_planner.get_mission_requirements()
-            predicted_conn = self.predictor.predict_connectivity()
-            
-            optimal_mode = self._select_optimal_mode(threat, mission, predicted_conn)
-            
+    async def run(self):
+        """The manager's main coroutine; await it directly when already running under asyncio."""
+        self._loop = asyncio.get_running_loop()
+        self._events = asyncio.Queue()
+        self.predicted_conn = self.predictor.predict_connectivity()
+        self.is_running = True
+        self._ready.set()
+        feed = asyncio.create_task(self._prediction_feed())
+        try:
+            await self._decision_loop()
+        finally:
+            feed.cancel()
+            if self._transition is not None and not self._transition.done():
+                self._transition.cancel()
+                await asyncio.gather(self._transition, return_exceptions=True)
+            await self.standby_pool.drain()
+            await self.transition_controller.drain()
+            self.is_running = False
+            self._loop = None
+            self._ready.clear()
+
+    def post_event(self, kind, value=None):
+        """Queues an event for the decision loop; callable from the loop or any other thread."""
+        event = CommEvent(kind, value)
+        loop = self._loop
+        if loop is None:
+            self._apply(event)   # Not running yet: just record the latest state
+            return
+        try:
+            on_loop = asyncio.get_running_loop() is loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._events.put_nowait(event)
+        else:
+            loop.call_soon_threadsafe(self._events.put_nowait, event)
+
+    def report_link_sample(self, mode, signal, latency_ms, loss):
+        """Link quality measurement for a mode, fed to the connectivity predictor.
+
+        Posts a LINK_SAMPLE event unless one for the same mode is still waiting to be
+        applied; that event picks up this sample when it recomputes the forecast.
+        """
+        mode = getattr(mode, "value", mode)
+        self.predictor.record(mode, signal, latency_ms, loss)
+        with self._sample_lock:
+            if mode in self._samples_pending:
+                self.samples_debounced += 1
+                return
+            self._samples_pending.add(mode)
+        self.post_event(LINK_SAMPLE, mode)
+
+    def report_module_status(self, mode, status):
+        """Module status change, e.g. {"active": False} when a link drops."""
+        self.post_event(MODULE_STATUS, (mode, status))
+
+    def force_comm_mode(self, mode):
+        """Operator or threat-response override (a CommMode or its value); None returns to automatic selection."""
+        self.post_event(OVERRIDE, CommMode(mode) if mode is not None else None)
+
+    async def _prediction_feed(self):
+        while True:
+            await asyncio.sleep(self.prediction_interval)
+            self.post_event(CONNECTIVITY, self.predictor.predict_connectivity())
+
+    def _is_urgent(self, event):
+        if event.kind == THREAT:
+            return event.value == "HIGH"
+        if event.kind == MODULE_STATUS:
+            mode, status = event.value
+            return mode == self.current_mode and not status.get("active", True)
+        return event.kind in (OVERRIDE, STOP)
+
+    def _apply(self, event):
+        if event.kind == THREAT:
+            self.threat_level = event.value
+        elif event.kind == MISSION:
+            self.mission = event.value
+        elif event.kind == CONNECTIVITY:
+            self.predicted_conn = event.value
+        elif event.kind == LINK_SAMPLE:
+            with self._sample_lock:
+                self._samples_pending.discard(event.value)
+            self.predicted_conn = self.predictor.predict_connectivity()
+        elif event.kind == MODULE_STATUS:
+            mode, status = event.value
+            self.module_status[mode] = status
+        elif event.kind == OVERRIDE:
+            self.forced_mode = event.value
+
+    async def _decision_loop(self):
+        # Decide once on startup, then only when something changes.
+        await self._decide(time.monotonic())
+        while True:
+            batch = [await self._events.get()]
+            if not self._is_urgent(batch[0]):
+                # Gather a burst for up to coalesce_window, but stop early for an urgent event.
+                deadline = self._loop.time() + self.coalesce_window
+                while (remaining := deadline - self._loop.time()) > 0:
+                    try:
+                        batch.append(await asyncio.wait_for(self._events.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+                    if self._is_urgent(batch[-1]):
+                        break
+            while not self._events.empty():
+                batch.append(self._events.get_nowait())
+            self.events_received += len(batch)
+            self.events_coalesced += len(batch) - 1
+            for event in batch:
+                self._apply(event)
+            if any(event.kind == STOP for event in batch):
+                return
+            await self._decide(min(event.created_at for event in batch))
+
+    async def _decide(self, triggered_at):
+        print(f"\n--- [CommManager] Decision (threat {self.threat_level}) ---")
+        self.decisions += 1
+        if self.current_mode is not None and not self.module_status.get(self.current_mode, {}).get("active", True):
+            print(f"[CommManager] {self.current_mode.value} link is down.")
+            self.module_status.pop(self.current_mode)
+            self.current_mode = None
+        # Only a transition that is still activating can be superseded; once traffic has switched
+        # over, current_mode is already the new mode and the old link is being taken down.
+        activating = self._activating_mode is not None and self._transition is not None \
+            and not self._transition.done()
+        target = self._activating_mode if activating else self.current_mode
+        candidate = self.forced_mode or self._select_optimal_mode(self.threat_level, self.mission, self.predicted_conn)
+        optimal_mode = self.selection_policy.choose(target, candidate, self._selection_margin(self.predicted_conn),
+                                                    mandatory=self.forced_mode is not None or self.threat_level == "HIGH")
+        if activating and self._activating_mode == optimal_mode:
+            pass   # Already on its way there
+        elif optimal_mode != self.current_mode or activating:
+            if activating:
+                self._transition.cancel()
+                self._activating_mode = None
             if optimal_mode != self.current_mode:
-                if self.transition_controller.transition_to(optimal_mode, self.current_mode):
-                    self.current_mode = optimal_mode
-                else:
-                    print("[CommManager] Transition failed. Re-evaluating next cycle.")
-            
-            time.sleep(5)
+                self.reaction_times.append(time.monotonic() - triggered_at)
+                self._activating_mode = optimal_mode
+                self._transition = asyncio.create_task(self._run_transition(optimal_mode))
+        self._plan_standby(optimal_mode)
+
+    def _plan_standby(self, optimal_mode):
+        """Ranks the modes likely to be needed next and lets the standby pool prepare them."""
+        forecast = self.predictor.predict_connectivity(seconds_ahead=self.standby_horizon)
+        likely = self._select_optimal_mode(self.threat_level, self.mission, forecast)
+        # The forecast's choice first, then the fallbacks for a threat (mesh) and for losing both (satellite).
+        ranked = [likely, CommMode.FIVE_G if likely == CommMode.MESH else CommMode.MESH, CommMode.SATELLITE]
+        if self.threat_level == "HIGH":
+            ranked.remove(CommMode.FIVE_G)   # Never associate with base stations under an active 5G threat
+        self.standby_pool.rebalance(ranked, in_use=optimal_mode)
+
+    async def _run_transition(self, mode):
+        try:
+            if not await self.transition_controller.transition_async(mode, self.current_mode,
+                                                                     on_switch_over=self._switched_over):
+                print("[CommManager] Transition failed. Re-evaluating on the next event.")
+        finally:
+            if self._transition is asyncio.current_task() and self._activating_mode == mode:
+                self._activating_mode = None
+
+    def _switched_over(self, mode):
+        self.current_mode = mode
+        self._activating_mode = None
 
     def _select_optimal_mode(self, threat, mission, predicted_conn):
         if threat == "HIGH":
             return CommMode.MESH
-        if mission["criticality"] == "HIGH" and predicted_conn["5g_signal"] > 0.6:
-            return CommMode.FIVE_G
-        if predicted_conn["5g_signal"] > 0.5:
+        if predicted_conn["5g_signal"] > self.FIVE_G_SIGNAL_THRESHOLD:
             return CommMode.FIVE_G
         return CommMode.MESH
 
+    def _selection_margin(self, predicted_conn):
+        """How far the input deciding between 5G and the mesh is from its threshold."""
+        return abs(predicted_conn["5g_signal"] - self.FIVE_G_SIGNAL_THRESHOLD)
+
 if __name__ == "__main__":
+    print("--- Connectivity forecasts ---")
+    # Ten minutes of 1 Hz samples: 5G fades as the drone leaves coverage, the mesh holds steady.
+    rng = np.random.default_rng(7)
+    seconds = np.arange(600.0)
+    five_g = np.clip(0.9 - 0.001 * seconds + rng.normal(0, 0.03, seconds.size), 0, 1)
+    mesh = np.clip(0.6 + rng.normal(0, 0.03, seconds.size), 0, 1)
+    for model in ("ewma", "holt"):
+        predictor = ConnectivityPredictor(model=model, clock=lambda: seconds[-1])
+        for t, five_g_signal, mesh_signal in zip(seconds, five_g, mesh):
+            predictor.record("5g", five_g_signal, 40 + 100 * (1 - five_g_signal), 0.01, timestamp=t)
+            predictor.record("mesh", mesh_signal, 120.0, 0.02, timestamp=t)
+        rmse = predictor.forecast_error_stats()["rmse"][1, :, 0]
+        print(f"{model}: 5G signal RMSE at {predictor.horizons.astype(int).tolist()} s ahead: "
+              f"{np.round(rmse, 3).tolist()}, trusted up to {predictor.trusted_horizon('5g', max_rmse=0.04):.0f} s")
+    calls = 20000
+    start = time.perf_counter()
+    for _ in range(calls):
+        predictor.forecast(15)
+    forecast_time = (time.perf_counter() - start) / calls
+    start = time.perf_counter()
+    for _ in range(calls):
+        prediction = predictor.predict_connectivity(15)
+    predict_time = (time.perf_counter() - start) / calls
+    start = time.perf_counter()
+    for t in range(calls):
+        predictor.record("satellite", 0.7, 650.0, 0.03, timestamp=600.0 + t)
+    record_time = (time.perf_counter() - start) / calls
+    print(f"forecast(): {forecast_time * 1e6:.1f} us, predict_connectivity(): {predict_time * 1e6:.1f} us, "
+          f"record(): {record_time * 1e6:.1f} us; 5G signal in 15 s: {prediction['5g_signal']:.2f}\n")
+
+    print("--- Flapping near the 5G threshold ---")
+    # Twenty minutes of a 5G signal hovering around the threshold, decided on once per second.
+    seconds = np.arange(1200.0)
+    five_g = np.clip(0.5 + 0.08 * np.sin(2 * np.pi * seconds / 300) + rng.normal(0, 0.04, seconds.size), 0, 1)
+    now = [0.0]
+    predictor = ConnectivityPredictor(clock=lambda: now[0])
+    policy = ModeSelectionPolicy(clock=lambda: now[0], default_cost=2.0)   # ~2 s to re-authenticate 5G
+    memoryless_mode, damped_mode = CommMode.MESH, CommMode.MESH
+    memoryless_switches = 0
+    for t, five_g_signal in zip(seconds, five_g):
+        now[0] = t
+        predictor.record("5g", five_g_signal, 40 + 100 * (1 - five_g_signal), 0.01)
+        forecast = predictor.predict_connectivity(seconds_ahead=5)
+        candidate = CommMode.FIVE_G if forecast["5g_signal"] > CommunicationManager.FIVE_G_SIGNAL_THRESHOLD \
+            else CommMode.MESH
+        memoryless_switches += candidate != memoryless_mode
+        memoryless_mode = candidate
+        damped_mode = policy.choose(damped_mode, candidate,
+                                    abs(forecast["5g_signal"] - CommunicationManager.FIVE_G_SIGNAL_THRESHOLD))
+    print(f"Memoryless rule: {memoryless_switches} switches ({memoryless_switches * policy.default_cost:.0f} s "
+          f"transitioning); with hysteresis {policy.hysteresis}, dwell and cost: {policy.switches} switches "
+          f"({policy.switches * policy.default_cost:.0f} s), {policy.flaps_avoided} flaps avoided "
+          f"({policy.dwell_holds} decisions held by dwell, {policy.margin_holds} by margin)\n")
+
     manager = CommunicationManager()
+    manager.security_framework.report_threat("LOW")
+    for _ in range(3):
+        manager.report_link_sample("5g", 0.8, 40.0, 0.01)
+        manager.report_link_sample("mesh", 0.6, 120.0, 0.02)
     manager.start()
     try:
-        time.sleep(20)
+        time.sleep(1)
+        # A burst of connectivity updates is folded into a single decision.
+        for signal in (0.75, 0.7, 0.72, 0.78):
+            manager.post_event(CONNECTIVITY, {"5g_signal": signal, "mesh_density": 0.6})
+        time.sleep(0.5)
+
+        # Forecasts dithering around the threshold: the policy keeps the 5G link instead of flapping.
+        for signal in (0.47, 0.53, 0.46, 0.52, 0.48):
+            manager.post_event(CONNECTIVITY, {"5g_signal": signal, "mesh_density": 0.6})
+            time.sleep(0.05)
+
+        # Satellite association takes 1-3 s, but the standby pool has already brought it up
+        # from the forecast, so failing over is a pointer swap.
+        time.sleep(3)
+        manager.force_comm_mode("satellite")
+        time.sleep(0.5)
+
+        # Fake base station detected: leave for the mesh immediately rather than on the next poll.
+        manager.force_comm_mode(None)
+        manager.security_framework.report_threat("HIGH")
+        time.sleep(0.5)
+
+        # Standby links are demoted once no forecast has wanted them for idle_timeout.
+        manager.standby_pool.idle_timeout = 0.0
+        manager.standby_pool.power_budget = 2.0
+        manager.post_event(CONNECTIVITY, {"5g_signal": 0.2, "mesh_density": 0.9})
+        time.sleep(0.5)
     except KeyboardInterrupt:
         pass
     finally:
         manager.stop()
-
-
-
+    controller = manager.transition_controller
+    reactions = ", ".join(f"{reaction * 1000:.2f} ms" for reaction in manager.reaction_times)
+    switchovers = ", ".join(f"{seconds * 1000:.0f} ms" for seconds in controller.switchover_times)
+    print(f"\nEvents: {manager.events_received} ({manager.events_coalesced} coalesced), "
+          f"decisions: {manager.decisions}, event-to-transition-start: {reactions}")
+    print(f"Transitions completed: {controller.transitions_completed}, cancelled: {controller.transitions_cancelled}, "
+          f"deadline misses: {controller.deadline_misses}; activation-to-switch-over: {switchovers} "
+          f"(the old link carried traffic throughout)")
+    policy = manager.selection_policy
+    costs = ", ".join(f"{old}->{new}: {seconds * 1000:.1f} ms" for (old, new), seconds in controller.transition_costs.items())
+    print(f"Mode selection - switches: {policy.switches}, flaps avoided: {policy.flaps_avoided}, "
+          f"time transitioning: {controller.transition_time:.2f} s; measured costs: {costs}")
+    pool = manager.standby_pool
+    print(f"Warm standby - warmups: {pool.warmups}, promotions: {controller.standby_promotions}, "
+          f"demotions: {pool.demotions}, standby now: {sorted(controller.standby)}")
@@ -0,0 +1,323 @@
+# Distributed link-state routing for the BitChat mesh.
+# Each node floods advertisements of its own links and keeps its routing table
+# up to date incrementally, instead of every node computing routes from a global map.
+
+import heapq
+from dataclasses import dataclass, field
+
+from mesh_event_simulator import EventScheduler
+
+INFINITY = float("inf")
+
+@dataclass
+class LinkStateAdvertisement:
+    """A node's advertisement of its current links and their costs."""
+    origin: str
+    sequence: int
+    links: dict = field(default_factory=dict)   # neighbor_id -> cost
+
+    def size_bytes(self):
+        # Header (origin, sequence, count) plus one (neighbor, cost) entry per link.
+        return 16 + 8 * len(self.links)
+
+class LinkStateRouter:
+    """One node's link-state database and incrementally maintained shortest-path tree.
+
+    When an advertisement changes some links, only the affected part of the tree
+    is recomputed: a worse or removed tree link re-roots just the subtree below
+    it, and a better link propagates improvements outward from where it lands.
+    """
+    def __init__(self, node_id):
+        self.node_id = node_id
+        self.lsdb = {}                  # origin -> LinkStateAdvertisement
+        self.out_edges = {}             # u -> {v: cost}
+        self.in_edges = {}              # v -> {u: cost}
+        self.dist = {node_id: 0.0}
+        self.parent = {node_id: None}
+        self.children = {node_id: set()}
+        self._next_hops = {}            # lazily rebuilt cache of destination -> first hop
+        self.nodes_recomputed = 0       # total nodes touched by SPF updates (work done)
+        self.sequence = 0
+
+    # --- Advertisements ---
+    def originate(self, links):
+        """Builds this node's next advertisement and installs it locally."""
+        self.sequence += 1
+        lsa = LinkStateAdvertisement(self.node_id, self.sequence, dict(links))
+        self.receive(lsa)
+        return lsa
+
+    def receive(self, lsa):
+        """Installs an advertisement if it is newer than the stored one.
+
+        Returns True if it was new (and should be flooded on), False if stale.
+        """
+        current = self.lsdb.get(lsa.origin)
+        if current is not None and current.sequence >= lsa.sequence:
+            return False
+        self.lsdb[lsa.origin] = lsa
+        self._apply(lsa.origin, current.links if current is not None else {}, lsa.links)
+        return True
+
+    # --- Incremental SPF ---
+    def _apply(self, origin, old_links, new_links):
+        increases, decreases = [], []
+        out = self.out_edges.setdefault(origin, {})
+        for neighbor in set(old_links) | set(new_links):
+            old_cost = old_links.get(neighbor, INFINITY)
+            new_cost = new_links.get(neighbor, INFINITY)
+            if new_cost == old_cost:
+                continue
+            if new_cost == INFINITY:
+                out.pop(neighbor, None)
+                self.in_edges.get(neighbor, {}).pop(origin, None)
+            else:
+                out[neighbor] = new_cost
+                self.in_edges.setdefault(neighbor, {})[origin] = new_cost
+            (increases if new_cost > old_cost else decreases).append((origin, neighbor))
+
+        changed = False
+        for u, v in increases:
+            changed |= self._handle_increase(u, v)
+        for u, v in decreases:
+            changed |= self._handle_decrease(u, v)
+        if changed:
+            self._next_hops.clear()
+        return changed
+
+    def _set_parent(self, node, parent):
+        old_parent = self.parent.get(node)
+        if old_parent is not None:
+            self.children[old_parent].discard(node)
+        self.parent[node] = parent
+        self.children.setdefault(node, set())
+        if parent is not None:
+            self.children.setdefault(parent, set()).add(node)
+
+    def _handle_increase(self, u, v):
+        """Link u->v got worse or disappeared; re-root the subtree below it if it was a tree link."""
+        if self.parent.get(v) != u:
+            return False
+
+        subtree = []
+        stack = [v]
+        while stack:
+            node = stack.pop()
+            subtree.append(node)
+            stack.extend(self.children.get(node, ()))
+        affected = set(subtree)
+        for node in subtree:
+            self.children[self.parent[node]].discard(node)
+            del self.parent[node]
+            del self.dist[node]
+
+        # Best entry into the affected region from the unaffected part of the tree.
+        heap = []
+        for node in subtree:
+            best, best_parent = INFINITY, None
+            for w, cost in self.in_edges.get(node, {}).items():
+                if w not in affected and w in self.dist and self.dist[w] + cost < best:
+                    best, best_parent = self.dist[w] + cost, w
+            if best_parent is not None:
+                self.dist[node] = best
+                self._set_parent(node, best_parent)
+                heapq.heappush(heap, (best, node))
+        self._relax(heap)
+        self.nodes_recomputed += len(subtree)
+        return True
+
+    def _handle_decrease(self, u, v):
+        """Link u->v got better or appeared; propagate any improvement from v."""
+        if u not in self.dist:
+            return False
+        candidate = self.dist[u] + self.out_edges[u][v]
+        if candidate >= self.dist.get(v, INFINITY):
+            return False
+        self.dist[v] = candidate
+        self._set_parent(v, u)
+        self._relax([(candidate, v)])
+        return True
+
+    def _relax(self, heap):
+        """Dijkstra relaxation seeded with the given (distance, node) entries."""
+        heapq.heapify(heap)
+        while heap:
+            d, node = heapq.heappop(heap)
+            if d > self.dist.get(node, INFINITY):
+                continue
+            self.nodes_recomputed += 1
+            for neighbor, cost in self.out_edges.get(node, {}).items():
+                nd = d + cost
+                if nd < self.dist.get(neighbor, INFINITY):
+                    self.dist[neighbor] = nd
+                    self._set_parent(neighbor, node)
+                    heapq.heappush(heap, (nd, neighbor))
+
+    # --- Routing table ---
+    def next_hop(self, destination):
+        """First hop towards the destination, or None if unreachable."""
+        if destination == self.node_id or destination not in self.dist:
+            return None
+        hop = self._next_hops.get(destination)
+        if hop is None:
+            node = destination
+            while self.parent[node] != self.node_id:
+                node = self.parent[node]
+            hop = self._next_hops[destination] = node
+        return hop
+
+    def route(self, destination):
+        """Full path (node IDs) from this node to the destination per the local tree, or None."""
+        if destination not in self.dist:
+            return None
+        path = [destination]
+        while path[-1] != self.node_id:
+            path.append(self.parent[path[-1]])
+        path.reverse()
+        return path
+
+    def distance(self, destination):
+        return self.dist.get(destination, INFINITY)
+
+class LinkStateSimulation:
+    """Floods link-state advertisements over a MeshTopology on the discrete-event clock.
+
+    Each advertisement a node accepts is forwarded to every neighbor except the one
+    it came from (classic flooding, so bootstrap traffic grows with nodes x links).
+    Reports how long routing tables take to converge after each event and how many
+    control messages (and bytes) that took.
+    """
+    def __init__(self, topology, link_delay=0.02, processing_delay=0.001, link_cost=None, scheduler=None):
+        self.topology = topology
+        self.link_delay = link_delay
+        self.processing_delay = processing_delay
+        self.link_cost = link_cost or (lambda u, v: 1.0)
+        self.scheduler = scheduler or EventScheduler()
+        self.routers = {node_id: LinkStateRouter(node_id) for node_id in topology.node_ids()}
+        self.control_messages = 0
+        self.control_bytes = 0
+        self._last_change = None
+
+    def router(self, node_id):
+        return self.routers[node_id]
+
+    def _links_of(self, node_id):
+        return {neighbor: self.link_cost(node_id, neighbor) for neighbor in self.topology.neighbors(node_id)}
+
+    def _originate(self, node_id):
+        router = self.routers.setdefault(node_id, LinkStateRouter(node_id))
+        lsa = router.originate(self._links_of(node_id))
+        self._last_change = self.scheduler.now
+        self._flood(node_id, lsa, came_from=None)
+
+    def _flood(self, node_id, lsa, came_from):
+        for neighbor in self.topology.neighbors(node_id):
+            if neighbor == came_from:
+                continue
+            self.control_messages += 1
+            self.control_bytes += lsa.size_bytes()
+            self.scheduler.schedule(self.link_delay + self.processing_delay, self._deliver, neighbor, lsa, node_id)
+
+    def _deliver(self, node_id, lsa, came_from):
+        router = self.routers.get(node_id)
+        if router is None:
+            return
+        before = router.nodes_recomputed
+        if router.receive(lsa):
+            if router.nodes_recomputed != before:
+                self._last_change = self.scheduler.now
+            self._flood(node_id, lsa, came_from)
+
+    def _converge(self, trigger):
+        start_time = self.scheduler.now
+        messages, data = self.control_messages, self.control_bytes
+        self._last_change = start_time
+        trigger()
+        self.scheduler.run()
+        return {
+            "convergence_time_s": self._last_change - start_time,
+            "control_messages": self.control_messages - messages,
+            "control_bytes": self.control_bytes - data,
+        }
+
+    def bootstrap(self):
+        """Every node advertises its links at once; returns convergence statistics."""
+        return self._converge(lambda: [self._originate(node_id) for node_id in self.topology.node_ids()])
+
+    def set_link(self, u, v, up):
+        """Brings a link up or down; both endpoints re-advertise. Returns convergence statistics.
+
+        A new link may join two previously partitioned parts of the swarm, so its
+        endpoints also exchange their databases, as OSPF does when an adjacency forms.
+        """
+        def trigger():
+            if up:
+                self.topology.add_link(u, v)
+                self._synchronize(u, v)
+                self._synchronize(v, u)
+            else:
+                self.topology.remove_link(u, v)
+            self._originate(u)
+            self._originate(v)
+        return self._converge(trigger)
+
+    def _synchronize(self, sender, receiver):
+        """Sends every advertisement in the sender's database across the new link."""
+        for lsa in list(self.routers[sender].lsdb.values()):
+            self.control_messages += 1
+            self.control_bytes += lsa.size_bytes()
+            self.scheduler.schedule(self.link_delay + self.processing_delay, self._deliver, receiver, lsa, sender)
+
+    def tables_consistent(self):
+        """True if every router's distances match a centralized computation over the topology."""
+        for node_id, router in self.routers.items():
+            dist = {node_id: 0.0}
+            heap = [(0.0, node_id)]
+            while heap:
+                d, node = heapq.heappop(heap)
+                if d > dist[node]:
+                    continue
+                for neighbor in self.topology.neighbors(node):
+                    nd = d + self.link_cost(node, neighbor)
+                    if nd < dist.get(neighbor, INFINITY):
+                        dist[neighbor] = nd
+                        heapq.heappush(heap, (nd, neighbor))
+            if dist != router.dist:
+                return False
+        return True
+
+# Example Usage:
+if __name__ == "__main__":
+    import random
+    import time
+    from mesh_topology import MeshTopology
+
+    random.seed(5)
+    num_nodes, radio_range = 200, 0.12
+    positions = [(random.random(), random.random()) for _ in range(num_nodes)]
+    topology = MeshTopology()
+    for i in range(num_nodes):
+        topology.add_node(f"Drone{i}")
+        for j in range(i):
+            if (positions[i][0] - positions[j][0]) ** 2 + (positions[i][1] - positions[j][1]) ** 2 <= radio_range ** 2:
+                topology.add_link(f"Drone{i}", f"Drone{j}")
+
+    simulation = LinkStateSimulation(topology, link_delay=0.02)
+
+    def report(label, stats):
+        print(f"{label}: converged in {stats['convergence_time_s'] * 1000:.0f} ms (simulated), "
+              f"{stats['control_messages']} control messages, {stats['control_bytes'] / 1024:.1f} KiB")
+
+    start = time.perf_counter()
+    report(f"Bootstrap ({num_nodes} nodes, {topology.link_count} links)", simulation.bootstrap())
+    print(f"  Tables consistent: {simulation.tables_consistent()} (wall time {time.perf_counter() - start:.2f} s)")
+
+    u = "Drone0"
+    v = next(iter(topology.neighbors(u)))
+    report(f"Link {u}-{v} down", simulation.set_link(u, v, up=False))
+    report(f"Link {u}-{v} up", simulation.set_link(u, v, up=True))
+    print(f"  Tables consistent: {simulation.tables_consistent()}")
+
+    router = simulation.router("Drone1")
+    destination = f"Drone{num_nodes - 1}"
+    print(f"Drone1 -> {destination}: next hop {router.next_hop(destination)}, route {router.route(destination)}")
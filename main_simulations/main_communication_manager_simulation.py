@@ -2,6 +2,8 @@
 # Cerberus v0.3 - Communication Manager Simulation
 # This file demonstrates the dynamic decision-making of the enhanced Communication Manager.
 
+import math
+import random
 import time
 import sys
 import os
@@ -34,14 +36,42 @@ if __name__ == "__main__":
 
     print("\n--- Simulation is running for 20 seconds (Press Ctrl+C to stop early) ---")
     try:
-        # The main thread just needs to wait while the manager runs in the background.
-        time.sleep(20)
+        # Link telemetry arrives twice a second (5G fading in and out of coverage, a steady
+        # mesh) and feeds the connectivity predictor. The threat detectors push a new
+        # assessment every few seconds; the manager reacts to each as it arrives instead
+        # of polling on a fixed cycle.
+        for step in range(40):
+            time.sleep(0.5)
+            five_g_signal = min(max(0.55 + 0.35 * math.sin(step / 6) + random.gauss(0, 0.03), 0.0), 1.0)
+            comm_manager.report_link_sample("5g", five_g_signal, 40 + 100 * (1 - five_g_signal), 0.01)
+            comm_manager.report_link_sample("mesh", 0.6 + random.gauss(0, 0.03), 120.0, 0.02)
+            if step % 8 == 7:
+                comm_manager.security_framework.report_threat(comm_manager.security_framework.get_threat_level())
     except KeyboardInterrupt:
         print("\n[Simulation] Stopping simulation...")
     finally:
-        # Stop the manager's decision loop
+        # Stop the manager's event loop
         comm_manager.stop()
 
+    reactions = sorted(comm_manager.reaction_times)
+    if reactions:
+        print(f"\nTransitions: {len(reactions)}, event-to-transition-start: "
+              f"median {reactions[len(reactions) // 2] * 1000:.2f} ms, max {reactions[-1] * 1000:.2f} ms")
+    print(f"Events: {comm_manager.events_received} ({comm_manager.events_coalesced} coalesced), "
+          f"decisions: {comm_manager.decisions}, link samples folded into pending events: "
+          f"{comm_manager.samples_debounced}")
+    controller = comm_manager.transition_controller
+    errors = comm_manager.predictor.forecast_error_stats()
+    print(f"5G signal forecast RMSE at {errors['horizons'].astype(int).tolist()} s: "
+          f"{[round(float(value), 3) for value in errors['rmse'][comm_manager.predictor.modes.index('5g'), :, 0]]}")
+    print(f"Make-before-break transitions completed: {controller.transitions_completed}, "
+          f"superseded: {controller.transitions_cancelled}, deadline misses: {controller.deadline_misses}")
+    policy = comm_manager.selection_policy
+    print(f"Mode selection - switches: {policy.switches}, flaps avoided: {policy.flaps_avoided}, "
+          f"time transitioning: {controller.transition_time:.2f} s")
+    print(f"Warm standby - warmups: {comm_manager.standby_pool.warmups}, "
+          f"instant failovers: {controller.standby_promotions}, demotions: {comm_manager.standby_pool.demotions}")
+
     print("\nCommunication Manager simulation complete.")
 
 
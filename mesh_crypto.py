@@ -0,0 +1,277 @@
+# Pluggable crypto engines for the BitChat onion and proof-of-relay protocols.
+# The protocols only call encrypt/decrypt/sign/verify_signature, so the mock
+# engines used in the examples and the real engine below are interchangeable.
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from cryptography.exceptions import InvalidSignature, InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey, X25519PublicKey
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+
+_P25519 = 2 ** 255 - 19
+
+def ed25519_to_x25519_public(public_key: bytes) -> bytes:
+    """Maps an Ed25519 public key to the X25519 public key of the same secret (u = (1+y)/(1-y))."""
+    y = int.from_bytes(public_key, "little") & ((1 << 255) - 1)
+    u = (1 + y) * pow(1 - y, _P25519 - 2, _P25519) % _P25519
+    return u.to_bytes(32, "little")
+
+def x25519_private_from_seed(private_key: bytes) -> X25519PrivateKey:
+    """The X25519 key matching an Ed25519 seed (the clamped first half of SHA-512(seed))."""
+    return X25519PrivateKey.from_private_bytes(hashlib.sha512(private_key).digest()[:32])
+
+def key_label(key) -> str:
+    """Short printable name for a key: the node name of a mock key, else a hex prefix."""
+    if isinstance(key, str):
+        return key.replace("pub_", "").replace("priv_", "")
+    return bytes(key[:4]).hex()
+
+class CryptoEngine:
+    """Interface the onion and proof-of-relay protocols program against.
+
+    Keys are opaque to the protocols: whatever a node holds as private_key and
+    public_key is passed straight through to its engine.
+
+    Ciphertext is the plaintext framed by LAYER_PREFIX bytes before it and
+    LAYER_SUFFIX bytes after it, which lets the onion protocol lay out a whole
+    packet in one buffer and encrypt every layer in place. Engines that can work
+    on buffers directly override encrypt_in_place/decrypt_into; the defaults
+    fall back to encrypt/decrypt plus a copy.
+    """
+    LAYER_PREFIX = 0
+    LAYER_SUFFIX = 0
+
+    def encrypt(self, data: bytes, public_key) -> bytes:
+        raise NotImplementedError
+
+    def decrypt(self, encrypted_data: bytes, private_key):
+        """Returns the plaintext, or None if the data is not for this key or was tampered with."""
+        raise NotImplementedError
+
+    def encrypt_in_place(self, buffer, start, length, public_key) -> int:
+        """Encrypts buffer[start + LAYER_PREFIX : + length] in place, filling in the framing around it.
+
+        Returns the ciphertext length (LAYER_PREFIX + length + LAYER_SUFFIX).
+        """
+        view = memoryview(buffer)
+        plaintext_start = start + self.LAYER_PREFIX
+        ciphertext = self.encrypt(bytes(view[plaintext_start:plaintext_start + length]), public_key)
+        if len(ciphertext) != self.LAYER_PREFIX + length + self.LAYER_SUFFIX:
+            raise ValueError(f"{type(self).__name__} ciphertext does not match its declared layer framing")
+        view[start:start + len(ciphertext)] = ciphertext
+        return len(ciphertext)
+
+    def replay_tag(self, encrypted_data) -> bytes:
+        """Short value identifying one encrypted layer, for replay filters."""
+        return hashlib.blake2b(encrypted_data, digest_size=16).digest()
+
+    def decrypt_into(self, encrypted_data, private_key, buffer):
+        """Decrypts into the start of buffer (at least len(encrypted_data) - framing bytes).
+
+        Returns the number of plaintext bytes written, or None on failure.
+        """
+        plaintext = self.decrypt(encrypted_data, private_key)
+        if plaintext is None:
+            return None
+        memoryview(buffer)[:len(plaintext)] = plaintext
+        return len(plaintext)
+
+    def sign(self, data, private_key):
+        raise NotImplementedError
+
+    def verify_signature(self, data, signature, public_key) -> bool:
+        raise NotImplementedError
+
+class AeadCryptoEngine(CryptoEngine):
+    """X25519 + HKDF + AEAD layer encryption and Ed25519 signatures.
+
+    A node's private key is a 32-byte Ed25519 seed and its public key the
+    32-byte Ed25519 public key; the matching X25519 keys are derived from them,
+    so one key serves routing, encryption and proofs. Every layer is encrypted
+    under a key agreed between a fresh ephemeral X25519 key and the recipient's
+    static key, carried as ephemeral public key (32) | ciphertext + tag (16).
+    Relays learn nothing about the sender and cannot link the layers of one
+    packet, and a layer stays secret even if the sender's key leaks later. The
+    price is one key agreement per layer on both sides; persistent circuits pay
+    it once per hop instead of per packet.
+    """
+    KEY_SIZE = 32
+    NONCE_SIZE = 12
+    TAG_SIZE = 16
+    LAYER_PREFIX = KEY_SIZE
+    LAYER_SUFFIX = TAG_SIZE
+    OVERHEAD = LAYER_PREFIX + LAYER_SUFFIX
+    CIPHERS = {"chacha20poly1305": ChaCha20Poly1305, "aesgcm": AESGCM}
+    _LAYER_NONCE = bytes(NONCE_SIZE)   # every layer key is fresh and encrypts exactly one layer
+
+    def __init__(self, private_key: bytes = None, cipher="chacha20poly1305", cache_size=1024):
+        """
+        Args:
+            private_key: This node's Ed25519 seed.
+            cipher: "chacha20poly1305" or "aesgcm".
+            cache_size: Number of per-peer keys kept in each LRU cache.
+        """
+        if cipher not in self.CIPHERS:
+            raise ValueError(f"Unknown cipher {cipher!r}; expected one of {sorted(self.CIPHERS)}")
+        self.aead_class = self.CIPHERS[cipher]
+        self.private_key = private_key
+        self.cache_size = cache_size
+        self._signing_keys = {}         # seed -> Ed25519PrivateKey
+        self._agreement_keys = {}       # seed -> (X25519PrivateKey, X25519 public bytes)
+        self._verify_keys = OrderedDict()
+        self._peer_agreement_keys = OrderedDict()   # Ed25519 public -> X25519 public
+        self.key_agreements = 0
+        self._lock = threading.Lock()   # guards the LRU caches when batch APIs use threads
+
+    @staticmethod
+    def generate_keypair():
+        """Returns a new (private_key, public_key) pair as raw bytes."""
+        seed = os.urandom(32)
+        public_key = Ed25519PrivateKey.from_private_bytes(seed).public_key().public_bytes(
+            Encoding.Raw, PublicFormat.Raw)
+        return seed, public_key
+
+    # --- Key handling ---
+    def _signing_key(self, private_key):
+        key = self._signing_keys.get(private_key)
+        if key is None:
+            key = self._signing_keys[private_key] = Ed25519PrivateKey.from_private_bytes(private_key)
+        return key
+
+    def _agreement_key(self, private_key):
+        entry = self._agreement_keys.get(private_key)
+        if entry is None:
+            key = x25519_private_from_seed(private_key)
+            entry = self._agreement_keys[private_key] = (key, key.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw))
+        return entry
+
+    def _peer_agreement_key(self, public_key):
+        x25519_public = self._peer_agreement_keys.get(public_key)
+        if x25519_public is None:
+            x25519_public = ed25519_to_x25519_public(public_key)
+            with self._lock:
+                self._peer_agreement_keys[public_key] = x25519_public
+                if len(self._peer_agreement_keys) > self.cache_size:
+                    self._peer_agreement_keys.popitem(last=False)
+        return x25519_public
+
+    def _new_layer_cipher(self, peer_x25519_public):
+        """Returns (ephemeral public key, AEAD) for one layer to the peer."""
+        ephemeral = X25519PrivateKey.generate()
+        ephemeral_public = ephemeral.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw)
+        return ephemeral_public, self.aead_class(
+            self._agree(ephemeral, ephemeral_public, peer_x25519_public, b"bitchat-onion-layer"))
+
+    def _layer_cipher(self, private_key, ephemeral_public):
+        """AEAD for a received layer; raises ValueError for a low-order ephemeral key."""
+        own_key, own_public = self._agreement_key(private_key)
+        return self.aead_class(self._agree(own_key, own_public, ephemeral_public, b"bitchat-onion-layer"))
+
+    def _agree(self, own_key, own_public, peer_x25519_public, info):
+        shared = own_key.exchange(X25519PublicKey.from_public_bytes(peer_x25519_public))
+        low, high = sorted((own_public, peer_x25519_public))
+        with self._lock:
+            self.key_agreements += 1
+        return HKDF(algorithm=hashes.SHA256(), length=self.KEY_SIZE, salt=None,
+                    info=info + low + high).derive(shared)
+
+    # --- Layer encryption ---
+    def encrypt(self, data: bytes, public_key: bytes) -> bytes:
+        ephemeral_public, aead = self._new_layer_cipher(self._peer_agreement_key(public_key))
+        return ephemeral_public + aead.encrypt(self._LAYER_NONCE, bytes(data), None)
+
+    def decrypt(self, encrypted_data: bytes, private_key: bytes):
+        if len(encrypted_data) < self.OVERHEAD:
+            return None
+        data = memoryview(encrypted_data)
+        try:
+            return self._layer_cipher(private_key, bytes(data[:self.KEY_SIZE])).decrypt(
+                self._LAYER_NONCE, data[self.LAYER_PREFIX:], None)
+        except (InvalidTag, ValueError):
+            return None
+
+    def encrypt_in_place(self, buffer, start, length, public_key) -> int:
+        ephemeral_public, aead = self._new_layer_cipher(self._peer_agreement_key(public_key))
+        view = memoryview(buffer)
+        view[start:start + self.KEY_SIZE] = ephemeral_public
+        plaintext_start = start + self.LAYER_PREFIX
+        aead.encrypt_into(self._LAYER_NONCE, view[plaintext_start:plaintext_start + length], None,
+                          view[plaintext_start:plaintext_start + length + self.TAG_SIZE])
+        return self.OVERHEAD + length
+
+    def replay_tag(self, encrypted_data) -> bytes:
+        # The AEAD tag already authenticates the whole layer; no need to hash it again.
+        return bytes(memoryview(encrypted_data)[-self.TAG_SIZE:])
+
+    def decrypt_into(self, encrypted_data, private_key, buffer):
+        length = len(encrypted_data) - self.OVERHEAD
+        if length < 0 or len(buffer) < length:
+            return None
+        data = memoryview(encrypted_data)
+        try:
+            self._layer_cipher(private_key, bytes(data[:self.KEY_SIZE])).decrypt_into(
+                self._LAYER_NONCE, data[self.LAYER_PREFIX:], None, memoryview(buffer)[:length])
+        except (InvalidTag, ValueError):
+            return None
+        return length
+
+    # --- Signatures ---
+    def sign(self, data, private_key: bytes) -> bytes:
+        return self._signing_key(private_key).sign(data.encode() if isinstance(data, str) else data)
+
+    def verify_signature(self, data, signature, public_key: bytes) -> bool:
+        key = self._verify_keys.get(public_key)
+        if key is None:
+            key = Ed25519PublicKey.from_public_bytes(public_key)
+            with self._lock:
+                self._verify_keys[public_key] = key
+                if len(self._verify_keys) > self.cache_size:
+                    self._verify_keys.popitem(last=False)
+        try:
+            key.verify(signature, data.encode() if isinstance(data, str) else data)
+            return True
+        except (InvalidSignature, TypeError, ValueError):
+            return False
+
+# Example Usage:
+if __name__ == "__main__":
+    import time
+
+    print("--- Per-hop layer crypto throughput ---")
+    for cipher in AeadCryptoEngine.CIPHERS:
+        sender_private, sender_public = AeadCryptoEngine.generate_keypair()
+        relay_private, relay_public = AeadCryptoEngine.generate_keypair()
+        sender = AeadCryptoEngine(sender_private, cipher)
+        relay = AeadCryptoEngine(relay_private, cipher)
+        for size in (64, 1024):
+            data = os.urandom(size)
+            rounds = 5000
+            start = time.perf_counter()
+            for _ in range(rounds):
+                layer = sender.encrypt(data, relay_public)
+            encrypt_time = (time.perf_counter() - start) / rounds
+            start = time.perf_counter()
+            for _ in range(rounds):
+                plaintext = relay.decrypt(layer, relay_private)
+            decrypt_time = (time.perf_counter() - start) / rounds
+            assert plaintext == data
+            print(f"{cipher:17s} {size:5d} B: encrypt {encrypt_time * 1e6:.1f} us, decrypt {decrypt_time * 1e6:.1f} us "
+                  f"({1 / decrypt_time:,.0f} layers/s), key agreements: {relay.key_agreements}")
+
+    second = sender.encrypt(data, relay_public)
+    print(f"Sender key in layer: {sender_public in layer or ed25519_to_x25519_public(sender_public) in layer}, "
+          f"two layers share a key prefix: {layer[:AeadCryptoEngine.KEY_SIZE] == second[:AeadCryptoEngine.KEY_SIZE]}")
+    tampered = bytearray(layer)
+    tampered[-1] ^= 1
+    print(f"Tampered layer rejected: {relay.decrypt(bytes(tampered), relay_private) is None}")
+
+    signature = sender.sign("MSG_1:relay", sender_private)
+    print(f"Ed25519 proof: {len(signature)} bytes, verifies: {relay.verify_signature('MSG_1:relay', signature, sender_public)}, "
+          f"tampered verifies: {relay.verify_signature('MSG_2:relay', signature, sender_public)}")
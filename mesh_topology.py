@@ -0,0 +1,167 @@
+# Shared topology graph for the BitChat mesh.
+# A single MeshTopology instance is shared by every node in a swarm, replacing
+# the per-node copies of the node map and the hard-coded neighbor table.
+
+from array import array
+
+class MeshTopology:
+    """Adjacency-indexed, mutable graph of bidirectional mesh links.
+
+    Every node gets a stable integer index on registration so bulk algorithms
+    can work on the compact CSR export instead of the dict-of-dicts adjacency.
+    Link changes are O(1) and bump a version counter that caches can key on.
+    """
+    def __init__(self):
+        self._adjacency = {}   # node_id -> {neighbor_id: None}, an insertion-ordered set
+        self._index = {}       # node_id -> stable integer index
+        self._ids = []         # integer index -> node_id
+        self._nodes = {}       # node_id -> node object registered with it (optional)
+        self.isolated = set()
+        self.link_count = 0
+        self.version = 0
+        self._listeners = []
+        self._csr = None
+        self._csr_version = -1
+
+    # --- Nodes ---
+    def add_node(self, node_id, node=None):
+        """Registers a node and returns its index. Re-adding updates the stored node object."""
+        if node is not None:
+            self._nodes[node_id] = node
+        if node_id in self._index:
+            return self._index[node_id]
+        index = len(self._ids)
+        self._index[node_id] = index
+        self._ids.append(node_id)
+        self._adjacency[node_id] = {}
+        self.version += 1
+        return index
+
+    def get_node(self, node_id):
+        return self._nodes.get(node_id)
+
+    def has_node(self, node_id):
+        return node_id in self._index
+
+    def node_ids(self):
+        return self._ids
+
+    def index_of(self, node_id):
+        return self._index[node_id]
+
+    def node_at(self, index):
+        return self._ids[index]
+
+    def __len__(self):
+        return len(self._ids)
+
+    def isolate_node(self, node_id):
+        """Drops every link of a node and refuses new ones until restore_node is called."""
+        if node_id not in self._index:
+            return
+        for neighbor_id in list(self._adjacency[node_id]):
+            self.remove_link(node_id, neighbor_id)
+        self.isolated.add(node_id)
+        self.version += 1
+        self._notify("node_isolated", node_id, None)
+
+    def restore_node(self, node_id):
+        """Lets an isolated node take links again; its old links are not brought back."""
+        if node_id not in self.isolated:
+            return
+        self.isolated.discard(node_id)
+        self.version += 1
+        self._notify("node_restored", node_id, None)
+
+    # --- Links ---
+    def add_link(self, u, v):
+        """Adds a bidirectional link. Returns False if it already exists or an endpoint is isolated."""
+        if u == v or u in self.isolated or v in self.isolated:
+            return False
+        self.add_node(u)
+        self.add_node(v)
+        if v in self._adjacency[u]:
+            return False
+        self._adjacency[u][v] = None
+        self._adjacency[v][u] = None
+        self.link_count += 1
+        self.version += 1
+        self._notify("link_added", u, v)
+        return True
+
+    def remove_link(self, u, v):
+        """Removes a bidirectional link. Returns False if it did not exist."""
+        if u not in self._adjacency or v not in self._adjacency[u]:
+            return False
+        del self._adjacency[u][v]
+        del self._adjacency[v][u]
+        self.link_count -= 1
+        self.version += 1
+        self._notify("link_removed", u, v)
+        return True
+
+    def has_link(self, u, v):
+        return u in self._adjacency and v in self._adjacency[u]
+
+    def neighbors(self, node_id):
+        """Iterable of neighbor IDs; empty for unknown nodes."""
+        adjacency = self._adjacency.get(node_id)
+        return adjacency.keys() if adjacency is not None else ()
+
+    def degree(self, node_id):
+        return len(self._adjacency.get(node_id, ()))
+
+    # --- Change notification ---
+    def add_listener(self, callback):
+        """Registers callback(change, u, v) for "link_added", "link_removed", "node_isolated" and "node_restored"."""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self, change, u, v):
+        for callback in self._listeners:
+            callback(change, u, v)
+
+    # --- Bulk export ---
+    def to_csr(self):
+        """Returns (indptr, indices) arrays in compressed sparse row form.
+
+        Neighbors of the node with index i are indices[indptr[i]:indptr[i + 1]].
+        The export is cached until the topology next changes.
+        """
+        if self._csr_version == self.version:
+            return self._csr
+        indptr = array("l", [0])
+        indices = array("l")
+        index = self._index
+        for node_id in self._ids:
+            indices.extend(index[neighbor_id] for neighbor_id in self._adjacency[node_id])
+            indptr.append(len(indices))
+        self._csr = (indptr, indices)
+        self._csr_version = self.version
+        return self._csr
+
+# Example Usage:
+if __name__ == "__main__":
+    topology = MeshTopology()
+    for u, v in [("Drone1", "Drone2"), ("Drone1", "Drone3"), ("Drone2", "Drone4"),
+                 ("Drone3", "Drone4"), ("Drone3", "BaseStation"), ("Drone4", "BaseStation")]:
+        topology.add_link(u, v)
+
+    topology.add_listener(lambda change, u, v: print(f"[MeshTopology] {change}: {u} {v or ''}"))
+
+    print(f"Nodes: {len(topology)}, Links: {topology.link_count}")
+    print(f"Drone3 neighbors: {list(topology.neighbors('Drone3'))}")
+
+    indptr, indices = topology.to_csr()
+    print(f"CSR indptr: {indptr.tolist()}")
+    print(f"CSR indices: {indices.tolist()}")
+
+    topology.isolate_node("Drone3")
+    print(f"After isolation - Links: {topology.link_count}, Drone1 neighbors: {list(topology.neighbors('Drone1'))}")
+    version = topology.version
+    topology.restore_node("Drone3")
+    topology.add_link("Drone3", "BaseStation")
+    print(f"After restore - Links: {topology.link_count}, version {version} -> {topology.version}")
@@ -2,21 +2,63 @@
 # Conceptual Pythonic Stub for Onion Routing in BitChat
 # This code illustrates the logic and would be integrated into BitChat's Swift codebase.
 
-import json
-import base64
+import hashlib
+import struct
 
-class MockCryptoEngine:
+from batch_pool import ChunkedThreadPool
+from mesh_crypto import CryptoEngine, key_label
+
+# Every layer's plaintext starts with a fixed-size routing header followed by the
+# inner packet: layer type, layer index, next hop key (length, flags and 32 bytes
+# zero-padded) and the length of what follows. Peeling a layer is a decrypt plus
+# two slices, and a packet grows by one header and the engine's overhead per hop.
+LAYER_RELAY = 0
+LAYER_FINAL = 1
+HOP_TEXT = 0x01   # next hop key was given as str rather than raw bytes
+ROUTING_HEADER = struct.Struct("!BBBB32sI")
+NEXT_HOP_SIZE = 32
+
+def _encode_hop(public_key) -> tuple:
+    """Returns (flags, key bytes) for a next hop key given as str or bytes."""
+    text = isinstance(public_key, str)
+    key = public_key.encode() if text else bytes(public_key)
+    if len(key) > NEXT_HOP_SIZE:
+        raise ValueError(f"Next hop key is longer than {NEXT_HOP_SIZE} bytes: {public_key!r}")
+    return (HOP_TEXT if text else 0), key
+
+def _decode_hop(flags, length, field):
+    key = bytes(field[:length])
+    return key.decode() if flags & HOP_TEXT else key
+
+class MockCryptoEngine(CryptoEngine):
     """A mock cryptographic engine to simulate encryption/decryption."""
-    def encrypt(self, data: str, public_key: str) -> str:
+    TAG_SIZE = 16
+    LAYER_PREFIX = TAG_SIZE
+
+    def _tag(self, key: str) -> bytes:
+        return hashlib.sha256(key.encode()).digest()[:self.TAG_SIZE]
+
+    def encrypt(self, data: bytes, public_key: str) -> bytes:
         # In a real scenario, this would be strong encryption (e.g., AES, Noise Protocol)
-        return base64.b64encode(f"ENCRYPTED({data})_FOR_{public_key}".encode()).decode()
+        return self._tag(public_key) + data
 
-    def decrypt(self, encrypted_data: str, private_key: str) -> str:
-        # In a real scenario, this would be strong decryption
-        decoded_data = base64.b64decode(encrypted_data.encode()).decode()
-        if f"_FOR_{private_key.replace('priv_', 'pub_')}" in decoded_data: # Simple check for mock
-            return decoded_data.replace(f"ENCRYPTED(", "").replace(f")_FOR_{private_key.replace('priv_', 'pub_')}", "")
-        return "DECRYPTION_FAILED"
+    def decrypt(self, encrypted_data: bytes, private_key: str):
+        # In a real scenario, this would be strong decryption. Returns None if not for this key.
+        if encrypted_data[:self.TAG_SIZE] != self._tag(private_key.replace("priv_", "pub_")):
+            return None
+        return encrypted_data[self.TAG_SIZE:]
+
+    def encrypt_in_place(self, buffer, start, length, public_key) -> int:
+        memoryview(buffer)[start:start + self.TAG_SIZE] = self._tag(public_key)
+        return self.TAG_SIZE + length
+
+    def decrypt_into(self, encrypted_data, private_key: str, buffer):
+        data = memoryview(encrypted_data)
+        length = len(data) - self.TAG_SIZE
+        if length < 0 or len(buffer) < length or data[:self.TAG_SIZE] != self._tag(private_key.replace("priv_", "pub_")):
+            return None
+        memoryview(buffer)[:length] = data[self.TAG_SIZE:]
+        return length
 
     def sign(self, data: str, private_key: str) -> str:
         return f"SIGNED({data})_BY_{private_key}"
@@ -26,12 +68,26 @@ class MockCryptoEngine:
 
 class BitChatOnionProtocol:
     """Conceptual implementation of onion routing for BitChat messages."""
-    def __init__(self, crypto_engine: MockCryptoEngine, my_private_key: str, my_public_key: str):
+    def __init__(self, crypto_engine: CryptoEngine, my_private_key, my_public_key, verbose=True, max_workers=None,
+                 replay_filter=None):
+        """
+        Args:
+            verbose: Print a line for every processed layer (off for high-rate relays).
+            max_workers: Thread pool size for the batch APIs (None: Python's default).
+            replay_filter: Optional RotatingCuckooFilter; layers seen before are dropped before decryption.
+        """
         self.crypto = crypto_engine
         self.my_private_key = my_private_key
         self.my_public_key = my_public_key
+        self.verbose = verbose
+        self.replay_filter = replay_filter
+        self._pool = ChunkedThreadPool(max_workers, thread_name_prefix="onion")
+
+    def _log(self, message):
+        if self.verbose:
+            print(message)
 
-    def create_onion_packet(self, message: str, relay_path: list, final_destination_public_key: str) -> str:
+    def create_onion_packet(self, message: str, relay_path: list, final_destination_public_key: str) -> bytes:
         """Creates an onion-encrypted packet for multi-hop relaying.
 
         Args:
@@ -40,36 +96,82 @@ class BitChatOnionProtocol:
             final_destination_public_key: The public key of the ultimate recipient.
 
         Returns:
-            A string representing the onion-encrypted packet.
+            The onion-encrypted packet as bytes.
         """
-        packet = message
-        
+        payload = message.encode()
+        prefix, suffix = self.crypto.LAYER_PREFIX, self.crypto.LAYER_SUFFIX
+        hops = len(relay_path)
+
+        # The whole packet is laid out in one buffer. Layer i (0 = outermost) starts
+        # i * (prefix + header) bytes in and ends i * suffix bytes before the end, so
+        # every layer's plaintext is its header followed by the already encrypted
+        # inner layer, and each layer is encrypted in place without copying the rest.
+        buffer = bytearray((hops + 1) * (prefix + ROUTING_HEADER.size + suffix) + len(payload))
+        start = hops * (prefix + ROUTING_HEADER.size)
+
         # Encrypt for the final destination first (innermost layer)
-        packet = self.crypto.encrypt(packet, final_destination_public_key)
-        
-        # Then, encrypt for each relay in reverse order of the path
-        # Each layer includes routing information for the next hop
-        for i, relay_node_pub_key in enumerate(reversed(relay_path)):
-            # Determine the next hop for this layer
-            if i == 0: # This is the last relay in the path, next hop is final destination
-                next_hop_for_this_layer = final_destination_public_key
-            else: # Next hop is the previous relay in the reversed list
-                next_hop_for_this_layer = relay_path[len(relay_path) - i].public_key # Access original path
-            
-            routing_header = {
-                "next_hop_pub_key": next_hop_for_this_layer,
-                "layer_index": len(relay_path) - i - 1 # Original index
-            }
-            
-            # The payload for this layer is the already encrypted inner packet
-            layer_payload = {"header": routing_header, "encrypted_inner_packet": packet}
-            
-            # Encrypt the entire layer payload for the current relay node
-            packet = self.crypto.encrypt(json.dumps(layer_payload), relay_node_pub_key)
-            
-        return packet
-
-    def process_onion_layer(self, encrypted_packet: str, my_private_key: str) -> tuple:
+        ROUTING_HEADER.pack_into(buffer, start + prefix, LAYER_FINAL, hops, 0, 0, b"", len(payload))
+        buffer[start + prefix + ROUTING_HEADER.size:start + prefix + ROUTING_HEADER.size + len(payload)] = payload
+        inner_length = self.crypto.encrypt_in_place(buffer, start, ROUTING_HEADER.size + len(payload),
+                                                    final_destination_public_key)
+
+        # Then, encrypt for each relay in reverse order of the path.
+        # Each layer's header names the next hop: the following relay, or the final destination.
+        next_hop = final_destination_public_key
+        for layer_index in range(hops - 1, -1, -1):
+            start -= prefix + ROUTING_HEADER.size
+            hop_flags, hop_key = _encode_hop(next_hop)
+            ROUTING_HEADER.pack_into(buffer, start + prefix, LAYER_RELAY, layer_index, hop_flags, len(hop_key),
+                                     hop_key, inner_length)
+            inner_length = self.crypto.encrypt_in_place(buffer, start, ROUTING_HEADER.size + inner_length,
+                                                        relay_path[layer_index])
+            next_hop = relay_path[layer_index]
+
+        return bytes(buffer)
+
+    def peel_into(self, encrypted_packet, buffer, my_private_key=None):
+        """Removes one layer, decrypting into a caller-supplied buffer (no allocation).
+
+        buffer must hold at least len(encrypted_packet) bytes minus the engine's
+        layer framing. The returned packet or message body is a read-only
+        memoryview into buffer, so it is only valid until the buffer is reused.
+
+        Returns:
+            (remaining_packet_or_message, next_hop_public_key, error); error is
+            None, "replay", "decryption_failed" or "malformed".
+        """
+        tag = None
+        if self.replay_filter is not None:
+            tag = self.crypto.replay_tag(encrypted_packet)
+            if self.replay_filter.seen(tag):
+                return None, None, "replay"
+
+        private_key = self.my_private_key if my_private_key is None else my_private_key
+        length = self.crypto.decrypt_into(encrypted_packet, private_key, buffer)
+        if length is None or length < ROUTING_HEADER.size:
+            return None, None, "decryption_failed"
+
+        layer = memoryview(buffer)[:length].toreadonly()
+        layer_type, _, hop_flags, hop_length, hop_key, body_length = ROUTING_HEADER.unpack_from(layer)
+        if length - ROUTING_HEADER.size != body_length:
+            return None, None, "malformed"
+        # Only authenticated layers are remembered, so forged packets cannot pre-empt real ones.
+        # Another thread may have accepted the same layer since the pre-check.
+        if tag is not None and self.replay_filter.check_and_add(tag):
+            return None, None, "replay"
+        body = layer[ROUTING_HEADER.size:]
+        if layer_type == LAYER_FINAL:
+            return str(body, "utf-8"), None, None
+        return body, _decode_hop(hop_flags, hop_length, hop_key), None
+
+    def _layer_size(self, encrypted_packet):
+        return max(0, len(encrypted_packet) - self.crypto.LAYER_PREFIX - self.crypto.LAYER_SUFFIX)
+
+    def _peel(self, encrypted_packet, my_private_key):
+        """Removes one layer into a fresh buffer sized for it: one allocation per hop."""
+        return self.peel_into(encrypted_packet, bytearray(self._layer_size(encrypted_packet)), my_private_key)
+
+    def process_onion_layer(self, encrypted_packet: bytes, my_private_key: str) -> tuple:
         """Processes one layer of the onion packet.
 
         Args:
@@ -80,25 +182,59 @@ class BitChatOnionProtocol:
             A tuple containing (remaining_encrypted_packet, next_hop_public_key).
             If this node is the final destination, remaining_encrypted_packet will be the decrypted message.
         """
-        decrypted_layer_str = self.crypto.decrypt(encrypted_packet, my_private_key)
-        
-        if "DECRYPTION_FAILED" in decrypted_layer_str:
-            print("Decryption failed for this layer. Packet not for me or corrupted.")
-            return None, None
-
-        try:
-            layer_data = json.loads(decrypted_layer_str)
-            header = layer_data["header"]
-            encrypted_inner_packet = layer_data["encrypted_inner_packet"]
-            
-            next_hop_pub_key = header["next_hop_pub_key"]
-            
-            print(f"[Node {my_private_key.replace('priv_', '')}] Decrypted layer. Next hop: {next_hop_pub_key}")
-            return encrypted_inner_packet, next_hop_pub_key
-        except json.JSONDecodeError:
-            # This might be the innermost layer (the actual message)
-            print(f"[Node {my_private_key.replace('priv_', '')}] Reached innermost layer. Message: {decrypted_layer_str}")
-            return decrypted_layer_str, None # No next hop, this is the final message
+        remaining, next_hop_pub_key, error = self._peel(encrypted_packet, my_private_key)
+        if error == "replay":
+            self._log(f"[Node {key_label(self.my_public_key)}] Replayed packet dropped before decryption.")
+        elif error == "decryption_failed":
+            self._log("Decryption failed for this layer. Packet not for me or corrupted.")
+        elif error == "malformed":
+            self._log("Malformed onion layer: length does not match header.")
+        elif next_hop_pub_key is None:
+            self._log(f"[Node {key_label(self.my_public_key)}] Reached innermost layer. Message: {remaining}")
+        else:
+            self._log(f"[Node {key_label(self.my_public_key)}] Decrypted layer. Next hop: {key_label(next_hop_pub_key)}")
+        return remaining, next_hop_pub_key
+
+    # --- Batch APIs ---
+    def create_onion_packets(self, requests) -> list:
+        """Builds many packets at once; the AEAD work releases the GIL, so it spreads over the pool.
+
+        Args:
+            requests: Iterable of (message, relay_path, final_destination_public_key).
+
+        Returns:
+            A list of (packet, error) in request order; error is None on success,
+            otherwise the reason that packet could not be built.
+        """
+        def build(request):
+            try:
+                return self.create_onion_packet(*request), None
+            except (ValueError, TypeError) as exc:
+                return None, str(exc)
+        return self._pool.map_chunks(build, list(requests))
+
+    def process_onion_layers(self, encrypted_packets, my_private_key=None) -> list:
+        """Peels one layer off each of many packets, without per-packet logging.
+
+        All packets decrypt into slices of a single buffer allocated for the batch,
+        and the remaining packets come back as memoryviews into it.
+
+        Returns:
+            A list of (remaining_packet_or_message, next_hop_public_key, error) in
+            input order; error is None, "replay", "decryption_failed" or "malformed".
+        """
+        packets = list(encrypted_packets)
+        sizes = [self._layer_size(packet) for packet in packets]
+        arena = memoryview(bytearray(sum(sizes)))
+        items, offset = [], 0
+        for packet, size in zip(packets, sizes):
+            items.append((packet, arena[offset:offset + size]))
+            offset += size
+        return self._pool.map_chunks(lambda item: self.peel_into(item[0], item[1], my_private_key), items)
+
+    def close(self):
+        """Shuts down the batch thread pool, if one was started."""
+        self._pool.close()
 
 # Example Usage:
 if __name__ == "__main__":
@@ -132,7 +268,7 @@ if __name__ == "__main__":
         relay_path_pub_keys,
         final_recipient.public_key
     )
-    print(f"Generated Onion Packet: {onion_packet}\n")
+    print(f"Generated Onion Packet: {len(onion_packet)} bytes ({onion_packet[:24].hex()}...)\n")
 
     print("--- Simulating Relaying Process ---")
     current_packet = onion_packet
@@ -141,13 +277,13 @@ if __name__ == "__main__":
     # Relay 1 processes the outermost layer
     print(f"\nRelay1 ({relay1.public_key}) receives packet...")
     current_packet, next_hop = relay1.protocol.process_onion_layer(current_packet, relay1.private_key)
-    print(f"Relay1 forwards: {current_packet} to {next_hop}")
+    print(f"Relay1 forwards: {len(current_packet)} bytes to {next_hop}")
 
     # Relay 2 processes the next layer
     if current_packet and next_hop == relay2.public_key:
         print(f"\nRelay2 ({relay2.public_key}) receives packet...")
         current_packet, next_hop = relay2.protocol.process_onion_layer(current_packet, relay2.private_key)
-        print(f"Relay2 forwards: {current_packet} to {next_hop}")
+        print(f"Relay2 forwards: {len(current_packet)} bytes to {next_hop}")
 
     # Final Recipient processes the innermost layer
     if current_packet and next_hop == final_recipient.public_key:
@@ -163,6 +299,41 @@ if __name__ == "__main__":
     assert final_message == original_message
     print("Original message successfully delivered and decrypted!")
 
+    print("\n--- Batch Build/Peel Throughput (real AEAD engine, 3 relays) ---")
+    import time
+    from mesh_crypto import AeadCryptoEngine
+
+    keys = [AeadCryptoEngine.generate_keypair() for _ in range(5)]
+    protocols = [BitChatOnionProtocol(AeadCryptoEngine(private), private, public, verbose=False)
+                 for private, public in keys]
+    origin, relays, recipient = protocols[0], protocols[1:4], protocols[4]
+    relay_keys = [relay.my_public_key for relay in relays]
+    for size in (64, 1024):
+        requests = [("x" * size, relay_keys, recipient.my_public_key)] * 5000
+        requests.append(("bad next hop", relay_keys, b"\0" * 40))   # over-long key: reported per packet
+        start = time.perf_counter()
+        built = origin.create_onion_packets(requests)
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        packets = [packet for packet, error in built if error is None]
+        for relay in relays:
+            packets = [remaining for remaining, _, _ in relay.process_onion_layers(packets)]
+        delivered = recipient.process_onion_layers(packets)
+        peel_time = time.perf_counter() - start
+        print(f"{size:5d} B: built {len(packets)} packets in {build_time * 1000:.0f} ms "
+              f"({sum(1 for _, error in built if error)} error), peeled 4 layers each in {peel_time * 1000:.0f} ms "
+              f"({4 * len(packets) / peel_time:,.0f} layers/s), all delivered: "
+              f"{all(message == 'x' * size for message, _, error in delivered)}")
+    for protocol in protocols:
+        protocol.close()
+
+    print("\n--- Packet Size by Hop Count (64-byte message) ---")
+    for hops in (1, 2, 4, 8):
+        relays = [f"pub_Relay{i}" for i in range(hops)]
+        size = len(sender.protocol.create_onion_packet("x" * 64, relays, final_recipient.public_key))
+        print(f"{hops} relay(s): {size} bytes")
+
 
 
 
@@ -0,0 +1,356 @@
+# K-shortest loopless path discovery for the BitChat mesh.
+# Replaces exhaustive path enumeration with Yen's algorithm so that only the
+# handful of candidate paths the RelayPathManager actually scores are produced.
+
+import heapq
+from collections import OrderedDict
+from itertools import count
+
+class KShortestPathsEngine:
+    """Finds the k shortest loopless paths between two mesh nodes (Yen's algorithm).
+
+    Mesh links are bidirectional, so a single search outward from the destination
+    gives the exact remaining distance from every node. That distance is used as
+    the A* heuristic for every spur search, which then expands little more than
+    the nodes on the path it returns. Memory is bounded by the distance map plus
+    at most k candidate paths.
+
+    With link costs and a hop limit together, the cheapest path may have too
+    many hops, so the distance map records the cheapest cost within each hop
+    budget and the searches run over (node, hops used) states instead.
+    """
+    def __init__(self, neighbors, weight=None, version=None, distance_cache_size=64, cost_version=None):
+        """
+        Args:
+            neighbors: Callable returning the neighbor IDs of a node ID.
+            weight: Optional callable (u, v) -> link cost, symmetric. Hop count is used when omitted.
+            version: Optional callable returning a counter that changes whenever the
+                graph changes. When given, distance maps are cached per destination,
+                which makes repeated queries towards hot destinations cheap.
+            cost_version: Optional callable returning a counter that changes whenever a
+                link cost changes; it is part of the cache version alongside version.
+                Cached maps that went stale without it are detected and rebuilt, but
+                may return costlier paths until then.
+        """
+        self.neighbors = neighbors
+        self.weight = weight
+        self.version = version
+        self.cost_version = cost_version
+        self.distance_cache_size = distance_cache_size
+        self._distance_cache = OrderedDict()
+        self._cache_version = None
+
+    @classmethod
+    def for_topology(cls, topology, weight=None, cost_version=None):
+        """Builds an engine over a shared MeshTopology; see __init__ for weight and cost_version."""
+        return cls(topology.neighbors, weight=weight, version=lambda: topology.version, cost_version=cost_version)
+
+    def shortest_paths(self, source, destination, k=3, max_hops=None):
+        """Returns up to k loopless paths (lists of node IDs), cheapest first."""
+        if k <= 0:
+            return []
+        if source == destination:
+            return [[source]]
+
+        dist = self._cached_distances_to(destination, max_hops)
+        if source not in dist:
+            return []
+
+        hop_limited = self.weight is not None and max_hops is not None
+        first = self._descend_within(source, dist, max_hops) if hop_limited else self._descend(source, dist)
+        if first is None:
+            # The cached map no longer matches the link costs; rebuild it once.
+            self._distance_cache.pop((destination, max_hops), None)
+            dist = self._cached_distances_to(destination, max_hops)
+            if source not in dist:
+                return []
+            first = self._descend_within(source, dist, max_hops) if hop_limited else self._descend(source, dist)
+            if first is None:
+                raise ValueError("link costs are inconsistent: weight(u, v) must be symmetric and "
+                                 "must not change during a query")
+        if max_hops is not None and len(first) - 1 > max_hops:
+            return []
+
+        accepted = [first]
+        candidates = []  # heap of (cost, tie_breaker, path)
+        seen = {first}
+        tie = count()
+
+        while len(accepted) < k:
+            previous = accepted[-1]
+            root_cost = 0
+            for j in range(len(previous) - 1):
+                spur_node = previous[j]
+                root = previous[:j + 1]
+
+                # Links leaving the spur node along already accepted paths that share this root.
+                blocked_edges = {p[j + 1] for p in accepted if len(p) > j + 1 and p[:j + 1] == root}
+                blocked_nodes = set(root[:-1])
+
+                if hop_limited:
+                    spur = self._spur_path_within(spur_node, destination, dist, blocked_nodes, blocked_edges,
+                                                  max_hops - j)
+                else:
+                    spur = self._spur_path(spur_node, destination, dist, blocked_nodes, blocked_edges)
+                if spur is not None:
+                    spur_path, spur_cost = spur
+                    path = root[:-1] + spur_path
+                    if path not in seen and (max_hops is None or len(path) - 1 <= max_hops):
+                        seen.add(path)
+                        heapq.heappush(candidates, (root_cost + spur_cost, next(tie), path))
+
+                root_cost += self._cost(previous[j], previous[j + 1])
+
+            if not candidates:
+                break
+
+            _, _, path = heapq.heappop(candidates)
+            accepted.append(path)
+
+            # Only the best (k - accepted) candidates can still be selected.
+            remaining = k - len(accepted)
+            if len(candidates) > remaining:
+                candidates = heapq.nsmallest(remaining, candidates)
+                heapq.heapify(candidates)
+
+        return [list(path) for path in accepted]
+
+    def _cost(self, u, v):
+        return 1 if self.weight is None else self.weight(u, v)
+
+    def _cached_distances_to(self, destination, max_hops):
+        if self.version is None:
+            return self._distances_to(destination, max_hops)
+        version = self.version() if self.cost_version is None else (self.version(), self.cost_version())
+        if version != self._cache_version:
+            self._distance_cache.clear()
+            self._cache_version = version
+        key = (destination, max_hops)
+        dist = self._distance_cache.get(key)
+        if dist is None:
+            dist = self._distances_to(destination, max_hops)
+            self._distance_cache[key] = dist
+            if len(self._distance_cache) > self.distance_cache_size:
+                self._distance_cache.popitem(last=False)
+        else:
+            self._distance_cache.move_to_end(key)
+        return dist
+
+    def _distances_to(self, destination, max_hops=None):
+        """Exact distance from every reachable node to the destination.
+
+        With hop-count costs the search stops at max_hops, since farther nodes
+        cannot lie on any admissible path. With link costs and max_hops, each
+        node maps to a list whose entry h is the cheapest cost using at most h hops.
+        """
+        if self.weight is not None and max_hops is not None:
+            return self._hop_limited_distances_to(destination, max_hops)
+        if self.weight is None:
+            dist = {destination: 0}
+            frontier = [destination]
+            depth = 0
+            while frontier and (max_hops is None or depth < max_hops):
+                depth += 1
+                next_frontier = []
+                for node in frontier:
+                    for neighbor in self.neighbors(node):
+                        if neighbor not in dist:
+                            dist[neighbor] = depth
+                            next_frontier.append(neighbor)
+                frontier = next_frontier
+            return dist
+
+        dist = {destination: 0}
+        heap = [(0, destination)]
+        while heap:
+            d, node = heapq.heappop(heap)
+            if d > dist[node]:
+                continue
+            for neighbor in self.neighbors(node):
+                nd = d + self.weight(neighbor, node)
+                if nd < dist.get(neighbor, float("inf")):
+                    dist[neighbor] = nd
+                    heapq.heappush(heap, (nd, neighbor))
+        return dist
+
+    def _hop_limited_distances_to(self, destination, max_hops):
+        """Bellman-Ford in max_hops rounds, relaxing only from nodes improved in the last round."""
+        inf = float("inf")
+        dist = {destination: [0] * (max_hops + 1)}
+        frontier = {destination}
+        for hops in range(1, max_hops + 1):
+            for costs in dist.values():
+                costs[hops] = costs[hops - 1]
+            improved = set()
+            for node in frontier:
+                base = dist[node][hops - 1]
+                for neighbor in self.neighbors(node):
+                    costs = dist.get(neighbor)
+                    if costs is None:
+                        costs = dist[neighbor] = [inf] * (max_hops + 1)
+                    cost = base + self.weight(neighbor, node)
+                    if cost < costs[hops]:
+                        costs[hops] = cost
+                        improved.add(neighbor)
+            frontier = improved
+            if not frontier:
+                for costs in dist.values():
+                    costs[hops + 1:] = [costs[hops]] * (max_hops - hops)
+                break
+        return dist
+
+    def _descend_within(self, source, dist, max_hops):
+        """_descend over a hop-limited distance map: the cheapest path of at most max_hops hops."""
+        path = [source]
+        node, hops = source, max_hops
+        while dist[node][hops] != 0:
+            if hops == 0:
+                return None
+            for neighbor in self.neighbors(node):
+                costs = dist.get(neighbor)
+                if costs is not None and costs[hops - 1] + self._cost(node, neighbor) == dist[node][hops]:
+                    node, hops = neighbor, hops - 1
+                    break
+            else:
+                return None
+            path.append(node)
+        return tuple(path)
+
+    def _descend(self, source, dist):
+        """Follows the distance map downhill to recover one shortest path.
+
+        Returns None if some node has no neighbor the map leads down to, i.e. the
+        map is stale.
+        """
+        path = [source]
+        node = source
+        while dist[node] != 0:
+            for neighbor in self.neighbors(node):
+                if neighbor in dist and dist[neighbor] + self._cost(node, neighbor) == dist[node]:
+                    node = neighbor
+                    break
+            else:
+                return None
+            path.append(node)
+        return tuple(path)
+
+    def _spur_path(self, spur_node, destination, dist, blocked_nodes, blocked_edges):
+        """A* from the spur node to the destination avoiding the blocked root.
+
+        Returns (path_tuple, cost) or None if the destination is unreachable.
+        """
+        if spur_node not in dist:
+            return None
+        best = {spur_node: 0}
+        parent = {spur_node: None}
+        tie = count()
+        heap = [(dist[spur_node], 0, next(tie), spur_node)]
+        closed = set()
+
+        while heap:
+            _, neg_g, _, node = heapq.heappop(heap)
+            g = -neg_g
+            if node in closed:
+                continue
+            if node == destination:
+                path = []
+                while node is not None:
+                    path.append(node)
+                    node = parent[node]
+                path.reverse()
+                return tuple(path), g
+            closed.add(node)
+
+            for neighbor in self.neighbors(node):
+                if neighbor in blocked_nodes or neighbor in closed or neighbor not in dist:
+                    continue
+                if node == spur_node and neighbor in blocked_edges:
+                    continue
+                ng = g + self._cost(node, neighbor)
+                if ng < best.get(neighbor, float("inf")):
+                    best[neighbor] = ng
+                    parent[neighbor] = node
+                    # Ties on f are broken towards deeper nodes so equal-cost detours are not expanded.
+                    heapq.heappush(heap, (ng + dist[neighbor], -ng, next(tie), neighbor))
+        return None
+
+    def _spur_path_within(self, spur_node, destination, dist, blocked_nodes, blocked_edges, max_hops):
+        """_spur_path over (node, hops used) states, for paths of at most max_hops hops.
+
+        The cheapest such path never repeats a node (with positive link costs,
+        cutting out the loop is cheaper and shorter), so it stays loopless.
+        """
+        inf = float("inf")
+        if max_hops < 0 or dist.get(spur_node, [inf])[max_hops] == inf:
+            return None
+        start = (spur_node, 0)
+        best = {start: 0}
+        parent = {start: None}
+        tie = count()
+        heap = [(dist[spur_node][max_hops], 0, next(tie), start)]
+        closed = set()
+
+        while heap:
+            _, neg_g, _, state = heapq.heappop(heap)
+            g = -neg_g
+            if state in closed:
+                continue
+            node, hops = state
+            if node == destination:
+                path = []
+                while state is not None:
+                    path.append(state[0])
+                    state = parent[state]
+                path.reverse()
+                return tuple(path), g
+            closed.add(state)
+            if hops == max_hops:
+                continue
+
+            remaining = max_hops - hops - 1
+            for neighbor in self.neighbors(node):
+                if neighbor in blocked_nodes or neighbor not in dist:
+                    continue
+                if node == spur_node and neighbor in blocked_edges:
+                    continue
+                estimate = dist[neighbor][remaining]
+                if estimate == inf:
+                    continue
+                next_state = (neighbor, hops + 1)
+                ng = g + self._cost(node, neighbor)
+                if next_state not in closed and ng < best.get(next_state, inf):
+                    best[next_state] = ng
+                    parent[next_state] = state
+                    heapq.heappush(heap, (ng + estimate, -ng, next(tie), next_state))
+        return None
+
+# Example Usage:
+if __name__ == "__main__":
+    import random
+    import time
+    from mesh_topology import MeshTopology
+
+    # Random geometric swarm of 1,000 drones with a short radio range.
+    random.seed(7)
+    num_nodes = 1000
+    positions = [(random.random(), random.random()) for _ in range(num_nodes)]
+    radio_range = 0.06
+    topology = MeshTopology()
+    for i in range(num_nodes):
+        topology.add_node(i)
+        xi, yi = positions[i]
+        for j in range(i + 1, num_nodes):
+            xj, yj = positions[j]
+            if (xi - xj) ** 2 + (yi - yj) ** 2 <= radio_range ** 2:
+                topology.add_link(i, j)
+
+    engine = KShortestPathsEngine.for_topology(topology)
+
+    source, destination = 0, num_nodes - 1
+    for label in ("cold", "cached"):
+        start = time.perf_counter()
+        paths = engine.shortest_paths(source, destination, k=3)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"--- Top {len(paths)} paths from {source} to {destination} ({label}: {elapsed_ms:.2f} ms) ---")
+    for path in paths:
+        print(f"{len(path) - 1} hops: {path}")
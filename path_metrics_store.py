@@ -0,0 +1,233 @@
+# Persistent, exponentially-weighted link and path metrics for the BitChat mesh.
+# Observed delivery outcomes are folded into EWMAs that the path scorer reads back,
+# so routing converges on good paths without re-probing every cycle.
+
+import sqlite3
+import time
+from collections import OrderedDict
+
+class PathMetrics:
+    """EWMA reliability, latency (ms) and bandwidth (kbps) for one link or path."""
+    __slots__ = ("reliability", "latency", "bandwidth", "samples", "updated_at")
+
+    def __init__(self, reliability=None, latency=None, bandwidth=None, samples=0, updated_at=0.0):
+        self.reliability = reliability
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.samples = samples
+        self.updated_at = updated_at
+
+    def __repr__(self):
+        return (f"PathMetrics(reliability={self.reliability}, latency={self.latency}, "
+                f"bandwidth={self.bandwidth}, samples={self.samples})")
+
+class PathMetricsStore:
+    """Bounded-memory EWMA metrics keyed by link and by path, backed by SQLite.
+
+    Hot entries live in an LRU dict so the scorer reads them in O(1). Updates are
+    written back in batches; evicted or cold entries are reloaded from the
+    database on demand, so history survives restarts without holding it all in memory.
+    Keys the database does not have are remembered in a second LRU, so paths
+    that were never observed do not cost a query on every scoring round.
+    """
+    QUERY_BATCH = 500   # keys per IN (...) query, under SQLite's bound-parameter limit
+
+    def __init__(self, db_path=":memory:", alpha=0.2, max_entries=10000, flush_every=256):
+        """
+        Args:
+            db_path: SQLite file holding the history (":memory:" for a non-persistent store).
+            alpha: EWMA smoothing factor; higher values favor recent observations.
+            max_entries: Maximum number of link/path entries held in memory (and of unknown keys remembered).
+            flush_every: Number of updates between batched writes to the database.
+        """
+        self.alpha = alpha
+        self.max_entries = max_entries
+        self.flush_every = flush_every
+        self._cache = OrderedDict()   # key -> PathMetrics
+        self._missing = OrderedDict()   # keys known to have no history -> None
+        self._dirty = set()
+        self._pending_updates = 0
+
+        self._db = sqlite3.connect(db_path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS metrics ("
+            " key TEXT PRIMARY KEY, reliability REAL, latency REAL, bandwidth REAL,"
+            " samples INTEGER, updated_at REAL)"
+        )
+        self._db.commit()
+
+    # --- Keys ---
+    @staticmethod
+    def link_key(u, v):
+        """Links are bidirectional, so the key is independent of direction."""
+        a, b = str(_node_id(u)), str(_node_id(v))
+        return "L|" + (f"{a}|{b}" if a <= b else f"{b}|{a}")
+
+    @staticmethod
+    def path_key(path):
+        return "P|" + "|".join(str(_node_id(node)) for node in path)
+
+    # --- Reads ---
+    def get(self, key):
+        """Returns the PathMetrics for a key, or None if it has never been observed."""
+        metrics = self._cache.get(key)
+        if metrics is not None:
+            self._cache.move_to_end(key)
+            return metrics
+        if key in self._missing:
+            self._missing.move_to_end(key)
+            return None
+        row = self._db.execute(
+            "SELECT reliability, latency, bandwidth, samples, updated_at FROM metrics WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self._remember_missing([key])
+            return None
+        metrics = PathMetrics(*row)
+        self._insert(key, metrics)
+        return metrics
+
+    def get_many(self, keys):
+        """Returns {key: PathMetrics} for those of keys that have history; cold keys are loaded QUERY_BATCH per query."""
+        found, cold = {}, []
+        for key in dict.fromkeys(keys):
+            metrics = self._cache.get(key)
+            if metrics is not None:
+                self._cache.move_to_end(key)
+                found[key] = metrics
+            elif key in self._missing:
+                self._missing.move_to_end(key)
+            else:
+                cold.append(key)
+        for start in range(0, len(cold), self.QUERY_BATCH):
+            batch = cold[start:start + self.QUERY_BATCH]
+            rows = self._db.execute(
+                "SELECT key, reliability, latency, bandwidth, samples, updated_at FROM metrics"
+                f" WHERE key IN ({','.join('?' * len(batch))})", batch
+            ).fetchall()
+            for key, *row in rows:
+                found[key] = metrics = PathMetrics(*row)
+                self._insert(key, metrics)
+            self._remember_missing([key for key in batch if key not in found])
+        return found
+
+    def get_link(self, u, v):
+        return self.get(self.link_key(u, v))
+
+    def get_path(self, path):
+        return self.get(self.path_key(path))
+
+    # --- Updates ---
+    def record_path(self, path, success=True, observed_latency=None, observed_bandwidth=None):
+        """Folds one delivery observation into the path entry and each of its links.
+
+        A successful delivery counts as a success for every link. On failure the
+        culprit is unknown, so each of the h links is charged 1/h of a failure.
+        Path latency is split evenly across links; the path bandwidth is a lower
+        bound for every link and is recorded as such.
+        """
+        now = time.time()
+        hops = len(path) - 1
+        self._update(self.path_key(path), 1.0 if success else 0.0, observed_latency, observed_bandwidth, now)
+        if hops <= 0:
+            return
+
+        link_reliability = 1.0 if success else 1.0 - 1.0 / hops
+        link_latency = observed_latency / hops if observed_latency is not None else None
+        for u, v in zip(path, path[1:]):
+            self._update(self.link_key(u, v), link_reliability, link_latency, observed_bandwidth, now)
+
+    def _update(self, key, reliability, latency, bandwidth, now):
+        metrics = self.get(key)
+        if metrics is None:
+            metrics = PathMetrics()
+            self._insert(key, metrics)
+
+        metrics.reliability = self._ewma(metrics.reliability, reliability)
+        metrics.latency = self._ewma(metrics.latency, latency)
+        metrics.bandwidth = self._ewma(metrics.bandwidth, bandwidth)
+        metrics.samples += 1
+        metrics.updated_at = now
+
+        self._dirty.add(key)
+        self._pending_updates += 1
+        if self._pending_updates >= self.flush_every:
+            self.flush()
+
+    def _ewma(self, current, sample):
+        if sample is None:
+            return current
+        if current is None:
+            return float(sample)
+        return (1.0 - self.alpha) * current + self.alpha * sample
+
+    # --- Memory bound and persistence ---
+    def _insert(self, key, metrics):
+        self._missing.pop(key, None)
+        self._cache[key] = metrics
+        while len(self._cache) > self.max_entries:
+            old_key, old_metrics = self._cache.popitem(last=False)
+            if old_key in self._dirty:
+                self._write([(old_key, old_metrics)])
+                self._dirty.discard(old_key)
+
+    def _remember_missing(self, keys):
+        for key in keys:
+            self._missing[key] = None
+        while len(self._missing) > self.max_entries:
+            self._missing.popitem(last=False)
+
+    def flush(self):
+        """Writes all modified in-memory entries to the database."""
+        if self._dirty:
+            self._write([(key, self._cache[key]) for key in self._dirty if key in self._cache])
+            self._dirty.clear()
+        self._pending_updates = 0
+
+    def _write(self, entries):
+        self._db.executemany(
+            "INSERT OR REPLACE INTO metrics (key, reliability, latency, bandwidth, samples, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            [(key, m.reliability, m.latency, m.bandwidth, m.samples, m.updated_at) for key, m in entries]
+        )
+        self._db.commit()
+
+    def close(self):
+        self.flush()
+        self._db.close()
+
+    def __len__(self):
+        return len(self._cache)
+
+def _node_id(node):
+    """Paths may hold node objects (with an .id) or plain node IDs."""
+    return getattr(node, "id", node)
+
+# Example Usage:
+if __name__ == "__main__":
+    import os
+    import tempfile
+
+    db_path = os.path.join(tempfile.gettempdir(), "path_metrics_example.db")
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    store = PathMetricsStore(db_path, alpha=0.3)
+    good_path = ["Drone1", "Drone3", "BaseStation"]
+    flaky_path = ["Drone1", "Drone2", "Drone4", "BaseStation"]
+
+    for _ in range(10):
+        store.record_path(good_path, success=True, observed_latency=110, observed_bandwidth=900)
+        store.record_path(flaky_path, success=False, observed_latency=400)
+
+    print(f"Good path:  {store.get_path(good_path)}")
+    print(f"Flaky path: {store.get_path(flaky_path)}")
+    print(f"Link Drone3<->Drone1: {store.get_link('Drone3', 'Drone1')}")
+    store.close()
+
+    # History survives a restart.
+    reopened = PathMetricsStore(db_path)
+    print(f"After reopening, good path: {reopened.get_path(good_path)}")
+    reopened.close()
+    os.remove(db_path)
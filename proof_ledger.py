@@ -0,0 +1,444 @@
+# Persistent, append-only ledger of relay proofs for post-mission audits.
+# Proofs are appended to segment files; each sealed segment gets sorted on-disk
+# indexes by message ID, by relay and by time, so lookups never replay the log.
+
+import hashlib
+import heapq
+import os
+import struct
+import time
+import zlib
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+
+# crc32 | timestamp | flags | message_id length | relay key length | proof length
+RECORD_HEADER = struct.Struct("!IdBHHH")
+KEY_IS_TEXT = 0x01
+PROOF_IS_TEXT = 0x02
+KEYS_ARE_PATH = 0x04   # the relay key field holds several keys, each prefixed by its 2-byte length
+KEY_LENGTH = struct.Struct("!H")
+INDEX_DTYPE = np.dtype([("key", "<u8"), ("offset", "<u8")])
+TIME_INDEX_DTYPE = np.dtype([("key", "<f8"), ("offset", "<u8")])
+INDEX_KINDS = ("message", "relay", "time")
+
+def _to_bytes(value):
+    """Returns (bytes, is_text) so mock string keys and proofs round-trip unchanged."""
+    if isinstance(value, str):
+        return value.encode(), True
+    return bytes(value), False
+
+def _key_hash(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+def _relay_keys(relay_public_key):
+    """The relay keys a record names: one key, or every key of a path given as a list or tuple."""
+    return tuple(relay_public_key) if isinstance(relay_public_key, (list, tuple)) else (relay_public_key,)
+
+class ProofRecord:
+    """One stored relay proof; relay_public_key is a tuple of keys for a proof covering a whole path."""
+    __slots__ = ("timestamp", "message_id", "relay_public_key", "proof")
+
+    def __init__(self, timestamp, message_id, relay_public_key, proof):
+        self.timestamp = timestamp
+        self.message_id = message_id
+        self.relay_public_key = relay_public_key
+        self.proof = proof
+
+    def __repr__(self):
+        relays = ",".join(key if isinstance(key, str) else key[:4].hex() for key in _relay_keys(self.relay_public_key))
+        return f"ProofRecord(timestamp={self.timestamp:.3f}, message_id={self.message_id!r}, relay={relays})"
+
+class _Segment:
+    __slots__ = ("number", "path", "records", "min_time", "max_time")
+
+    def __init__(self, number, path, records=0, min_time=float("inf"), max_time=float("-inf")):
+        self.number = number
+        self.path = path
+        self.records = records
+        self.min_time = min_time
+        self.max_time = max_time
+
+    def index_path(self, kind):
+        return f"{self.path[:-4]}.{kind}.npy"
+
+class ProofLedger:
+    """Append-only store of (timestamp, message_id, relay key(s), proof) records.
+
+    Records are appended to the active segment file, whose index entries are
+    kept in compact in-memory arrays. When the segment reaches segment_records
+    or segment_bytes it is sealed: its three indexes are sorted and written next
+    to it, and from then on it is searched through memory-mapped binary search.
+    Memory is bounded by one segment's index arrays plus a small LRU of open
+    sealed segments, however long the ledger grows.
+
+    A record may name every relay of a path, e.g. for one signed attestation
+    per message; it is then indexed under each of them.
+
+    Every record carries a CRC, so a torn write at the tail of the active
+    segment is truncated away when the ledger is reopened.
+    """
+    def __init__(self, directory, segment_records=1 << 18, segment_bytes=64 << 20, flush_every=1024,
+                 max_open_segments=16, clock=time.time):
+        """
+        Args:
+            directory: Directory holding the segment and index files (created if missing).
+            segment_records: Records per segment before it is sealed.
+            segment_bytes: Segment file size before it is sealed.
+            flush_every: Number of appends between flushes of the write buffer to the OS.
+            max_open_segments: Sealed segments whose files and indexes stay open for queries.
+            clock: Source of timestamps for appends that do not pass one.
+        """
+        self.directory = directory
+        self.segment_records = segment_records
+        self.segment_bytes = segment_bytes
+        self.flush_every = flush_every
+        self.max_open_segments = max_open_segments
+        self.clock = clock
+        self._sealed = []              # _Segment, oldest first
+        self._open = OrderedDict()     # segment number -> (fd, {kind: memmapped index})
+        self._writer = None
+        self._unflushed = 0
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+    # --- Opening and recovery ---
+    def _segment_path(self, number):
+        return os.path.join(self.directory, f"{number:08d}.seg")
+
+    def _recover(self):
+        numbers = sorted(int(name[:-4]) for name in os.listdir(self.directory)
+                         if name.endswith(".seg") and name[:-4].isdigit())
+        active = None
+        for position, number in enumerate(numbers):
+            segment = _Segment(number, self._segment_path(number))
+            if all(os.path.exists(segment.index_path(kind)) for kind in INDEX_KINDS):
+                times = np.load(segment.index_path("time"), mmap_mode="r")
+                segment.records = len(times)
+                if len(times):
+                    segment.min_time, segment.max_time = float(times["key"][0]), float(times["key"][-1])
+                self._sealed.append(segment)
+            elif position == len(numbers) - 1:
+                active = segment
+            else:
+                # Crashed while sealing: rebuild the indexes from the segment itself.
+                self._start_active(segment)
+                self._seal()
+        self._start_active(active or _Segment(numbers[-1] + 1 if numbers else 0,
+                                              self._segment_path(numbers[-1] + 1 if numbers else 0)))
+
+    def _start_active(self, segment):
+        self._active = segment
+        self._message_keys = array("Q")
+        self._relay_keys = array("Q")
+        self._relay_offsets = array("Q")   # a path record has one relay index entry per relay
+        self._timestamps = array("d")
+        self._offsets = array("Q")
+        valid_end = 0
+        if os.path.exists(segment.path):
+            for offset, end, record in self._scan_file(segment.path):
+                self._index(record, offset)
+                valid_end = end
+            if os.path.getsize(segment.path) != valid_end:
+                os.truncate(segment.path, valid_end)
+        self._writer = open(segment.path, "ab", buffering=1 << 20)
+        self._write_offset = valid_end
+
+    @staticmethod
+    def _scan_file(path):
+        """Yields (offset, end offset, ProofRecord) for each intact record, stopping at the first bad one."""
+        with open(path, "rb") as segment_file:
+            data = segment_file.read()
+        offset = 0
+        while offset + RECORD_HEADER.size <= len(data):
+            crc, timestamp, flags, message_length, key_length, proof_length = RECORD_HEADER.unpack_from(data, offset)
+            end = offset + RECORD_HEADER.size + message_length + key_length + proof_length
+            if end > len(data) or zlib.crc32(data[offset + 4:end]) != crc:
+                return
+            yield offset, end, ProofLedger._decode(data[offset:end])
+            offset = end
+
+    def _index(self, record, offset):
+        self._message_keys.append(_key_hash(record.message_id.encode()))
+        for key in _relay_keys(record.relay_public_key):
+            self._relay_keys.append(_key_hash(_to_bytes(key)[0]))
+            self._relay_offsets.append(offset)
+        self._timestamps.append(record.timestamp)
+        self._offsets.append(offset)
+        self._active.records += 1
+        self._active.min_time = min(self._active.min_time, record.timestamp)
+        self._active.max_time = max(self._active.max_time, record.timestamp)
+
+    # --- Writes ---
+    def append(self, message_id: str, relay_public_key, proof, timestamp=None):
+        """Stores one proof; timestamp defaults to the ledger's clock.
+
+        relay_public_key is one relay's key, or a list of keys when the proof
+        covers a whole relay path.
+        """
+        timestamp = self.clock() if timestamp is None else timestamp
+        message = message_id.encode()
+        if isinstance(relay_public_key, (list, tuple)):
+            encoded = [_to_bytes(key) for key in relay_public_key]
+            key = b"".join(KEY_LENGTH.pack(len(data)) + data for data, _ in encoded)
+            key_is_text = bool(encoded) and encoded[0][1]
+            relay_hashes = [_key_hash(data) for data, _ in encoded]
+            flags = KEYS_ARE_PATH
+        else:
+            key, key_is_text = _to_bytes(relay_public_key)
+            relay_hashes = (_key_hash(key),)
+            flags = 0
+        proof_bytes, proof_is_text = _to_bytes(proof)
+        flags |= (KEY_IS_TEXT if key_is_text else 0) | (PROOF_IS_TEXT if proof_is_text else 0)
+        body = RECORD_HEADER.pack(0, timestamp, flags, len(message), len(key), len(proof_bytes))[4:] + message + key + proof_bytes
+        self._writer.write(zlib.crc32(body).to_bytes(4, "big") + body)
+
+        offset = self._write_offset
+        self._write_offset += 4 + len(body)
+        self._message_keys.append(_key_hash(message))
+        for relay_hash in relay_hashes:
+            self._relay_keys.append(relay_hash)
+            self._relay_offsets.append(offset)
+        self._timestamps.append(timestamp)
+        self._offsets.append(offset)
+        active = self._active
+        active.records += 1
+        if timestamp < active.min_time:
+            active.min_time = timestamp
+        if timestamp > active.max_time:
+            active.max_time = timestamp
+
+        self._unflushed += 1
+        if self._unflushed >= self.flush_every:
+            self.flush()
+        if active.records >= self.segment_records or self._write_offset >= self.segment_bytes:
+            self._seal()
+            number = active.number + 1
+            self._start_active(_Segment(number, self._segment_path(number)))
+
+    def append_many(self, records):
+        """Stores (message_id, relay_public_key(s), proof[, timestamp]) tuples."""
+        for record in records:
+            self.append(*record)
+
+    def flush(self, sync=False):
+        """Hands buffered records to the OS; with sync=True also waits for them to reach the disk."""
+        self._writer.flush()
+        if sync:
+            os.fsync(self._writer.fileno())
+        self._unflushed = 0
+
+    def _seal(self):
+        self.flush(sync=True)
+        self._writer.close()
+        self._writer = None
+        segment = self._active
+        offsets = np.frombuffer(self._offsets, dtype=np.uint64)
+        columns = {
+            "message": (np.frombuffer(self._message_keys, dtype=np.uint64), offsets, INDEX_DTYPE),
+            "relay": (np.frombuffer(self._relay_keys, dtype=np.uint64), np.frombuffer(self._relay_offsets, dtype=np.uint64),
+                      INDEX_DTYPE),
+            "time": (np.frombuffer(self._timestamps, dtype=np.float64), offsets, TIME_INDEX_DTYPE),
+        }
+        # The time index is written last: its presence marks the segment as sealed.
+        for kind in INDEX_KINDS:
+            keys, offsets, dtype = columns[kind]
+            order = np.argsort(keys, kind="stable")
+            index = np.empty(len(keys), dtype=dtype)
+            index["key"] = keys[order]
+            index["offset"] = offsets[order]
+            temporary = segment.index_path(kind) + ".tmp"
+            with open(temporary, "wb") as index_file:
+                np.save(index_file, index)
+                index_file.flush()
+                os.fsync(index_file.fileno())
+            os.replace(temporary, segment.index_path(kind))
+        self._sealed.append(segment)
+
+    # --- Reads ---
+    def _read(self, fd, offset):
+        header = os.pread(fd, RECORD_HEADER.size, offset)
+        _, _, _, message_length, key_length, proof_length = RECORD_HEADER.unpack(header)
+        return self._decode(header + os.pread(fd, message_length + key_length + proof_length,
+                                              offset + RECORD_HEADER.size))
+
+    @staticmethod
+    def _decode(data):
+        _, timestamp, flags, message_length, key_length, proof_length = RECORD_HEADER.unpack_from(data)
+        start = RECORD_HEADER.size
+        message_id = bytes(data[start:start + message_length]).decode()
+        start += message_length
+        key = bytes(data[start:start + key_length])
+        proof = bytes(data[start + key_length:start + key_length + proof_length])
+        if flags & KEYS_ARE_PATH:
+            keys, position = [], 0
+            while position < len(key):
+                (length,) = KEY_LENGTH.unpack_from(key, position)
+                keys.append(key[position + KEY_LENGTH.size:position + KEY_LENGTH.size + length])
+                position += KEY_LENGTH.size + length
+            relay_public_key = tuple(k.decode() if flags & KEY_IS_TEXT else k for k in keys)
+        else:
+            relay_public_key = key.decode() if flags & KEY_IS_TEXT else key
+        return ProofRecord(timestamp, message_id, relay_public_key, proof.decode() if flags & PROOF_IS_TEXT else proof)
+
+    def _open_segment(self, segment):
+        entry = self._open.get(segment.number)
+        if entry is not None:
+            self._open.move_to_end(segment.number)
+            return entry
+        entry = (os.open(segment.path, os.O_RDONLY),
+                 {kind: np.load(segment.index_path(kind), mmap_mode="r") for kind in INDEX_KINDS})
+        self._open[segment.number] = entry
+        if len(self._open) > self.max_open_segments:
+            _, (fd, _) = self._open.popitem(last=False)
+            os.close(fd)
+        return entry
+
+    def _lookup(self, kind, key_hash, start=float("-inf"), end=float("inf")):
+        """Yields (fd, offsets) of every segment holding records whose kind-key hashes to key_hash.
+
+        Segments whose records all fall outside start <= timestamp < end are skipped unopened.
+        """
+        for segment in self._sealed:
+            if segment.max_time < start or segment.min_time >= end:
+                continue
+            fd, indexes = self._open_segment(segment)
+            keys = indexes[kind]["key"]
+            low, high = np.searchsorted(keys, key_hash, "left"), np.searchsorted(keys, key_hash, "right")
+            if high > low:
+                yield fd, np.array(indexes[kind]["offset"][low:high])
+        active = self._active
+        if active.records and active.max_time >= start and active.min_time < end:
+            self.flush()
+            column, offsets = ((self._message_keys, self._offsets) if kind == "message"
+                               else (self._relay_keys, self._relay_offsets))
+            offsets = np.frombuffer(offsets, dtype=np.uint64)[np.frombuffer(column, dtype=np.uint64) == key_hash]
+            if len(offsets):
+                fd = os.open(self._active.path, os.O_RDONLY)
+                try:
+                    yield fd, offsets
+                finally:
+                    os.close(fd)
+
+    def by_message(self, message_id: str) -> list:
+        """Every proof stored for message_id, oldest first."""
+        records = [record for fd, offsets in self._lookup("message", _key_hash(message_id.encode()))
+                   for record in (self._read(fd, int(offset)) for offset in offsets)
+                   if record.message_id == message_id]
+        records.sort(key=lambda record: record.timestamp)
+        return records
+
+    def by_relay(self, relay_public_key, start=None, end=None) -> list:
+        """Every proof naming one relay, oldest first, optionally limited to start <= timestamp < end."""
+        start = float("-inf") if start is None else start
+        end = float("inf") if end is None else end
+        records = [record for fd, offsets in self._lookup("relay", _key_hash(_to_bytes(relay_public_key)[0]), start, end)
+                   for record in (self._read(fd, int(offset)) for offset in offsets)
+                   if relay_public_key in _relay_keys(record.relay_public_key) and start <= record.timestamp < end]
+        records.sort(key=lambda record: record.timestamp)
+        return records
+
+    def scan(self, start=None, end=None):
+        """Yields every proof with start <= timestamp < end, in timestamp order."""
+        start = float("-inf") if start is None else start
+        end = float("inf") if end is None else end
+        runs = [self._scan_sealed(segment, start, end) for segment in self._sealed
+                if segment.max_time >= start and segment.min_time < end]
+        if self._active.records and self._active.max_time >= start and self._active.min_time < end:
+            runs.append(self._scan_active(start, end))
+        # Segments only overlap in time when proofs were appended out of order.
+        yield from heapq.merge(*runs, key=lambda record: record.timestamp)
+
+    def _scan_sealed(self, segment, start, end):
+        # heapq.merge keeps every run open at once, so a run reads through its own descriptor
+        # rather than one the open-segment LRU may close while the scan is still going.
+        _, indexes = self._open_segment(segment)
+        times = indexes["time"]
+        low, high = np.searchsorted(times["key"], start, "left"), np.searchsorted(times["key"], end, "left")
+        offsets = np.array(times["offset"][low:high])
+        fd = os.open(segment.path, os.O_RDONLY)
+        try:
+            for offset in offsets:
+                yield self._read(fd, int(offset))
+        finally:
+            os.close(fd)
+
+    def _scan_active(self, start, end):
+        self.flush()
+        timestamps = np.frombuffer(self._timestamps, dtype=np.float64)
+        selected = np.flatnonzero((timestamps >= start) & (timestamps < end))
+        offsets = np.frombuffer(self._offsets, dtype=np.uint64)[selected[np.argsort(timestamps[selected], kind="stable")]]
+        del timestamps
+        fd = os.open(self._active.path, os.O_RDONLY)
+        try:
+            for offset in offsets:
+                yield self._read(fd, int(offset))
+        finally:
+            os.close(fd)
+
+    def __len__(self):
+        return sum(segment.records for segment in self._sealed) + self._active.records
+
+    @property
+    def segments(self):
+        return len(self._sealed) + 1
+
+    @property
+    def index_memory_bytes(self):
+        """Bytes held by the active segment's in-memory index arrays."""
+        return sum(column.itemsize * len(column) for column in
+                   (self._message_keys, self._relay_keys, self._relay_offsets, self._timestamps, self._offsets))
+
+    def close(self):
+        if self._writer is not None:
+            self.flush(sync=True)
+            self._writer.close()
+            self._writer = None
+        for fd, _ in self._open.values():
+            os.close(fd)
+        self._open.clear()
+
+# Example Usage:
+if __name__ == "__main__":
+    import tempfile
+
+    directory = tempfile.mkdtemp(prefix="proof-ledger-")
+    relays = [os.urandom(32) for _ in range(50)]
+    ledger = ProofLedger(directory, segment_records=64000)
+
+    print("--- Sustained ingest ---")
+    count = 200000
+    start = time.perf_counter()
+    for i in range(count):
+        ledger.append(f"MSG_{i // 3}", relays[i % len(relays)], os.urandom(32), timestamp=1000.0 + i / 10000)
+    elapsed = time.perf_counter() - start
+    print(f"Appended {count:,} proofs in {elapsed:.2f} s ({count / elapsed:,.0f} proofs/s) "
+          f"across {ledger.segments} segments; in-memory index: {ledger.index_memory_bytes / 1024:.0f} KiB")
+
+    print("\n--- Queries ---")
+    start = time.perf_counter()
+    records = ledger.by_message("MSG_12345")
+    print(f"by_message: {len(records)} proofs in {(time.perf_counter() - start) * 1000:.2f} ms -> {records[0]}")
+    start = time.perf_counter()
+    records = ledger.by_relay(relays[7], start=1005.0, end=1006.0)
+    print(f"by_relay over 1 s: {len(records)} proofs in {(time.perf_counter() - start) * 1000:.2f} ms")
+    start = time.perf_counter()
+    records = list(ledger.scan(1009.5, 1010.5))
+    ordered = all(a.timestamp <= b.timestamp for a, b in zip(records, records[1:]))
+    print(f"scan over 1 s spanning a segment boundary: {len(records):,} proofs in "
+          f"{(time.perf_counter() - start) * 1000:.1f} ms, in time order: {ordered}")
+
+    # One attestation per message, naming its whole relay path, is found under each relay.
+    ledger.append("MSG_PATH", relays[:3], os.urandom(64), timestamp=1020.0)
+    print(f"Path record under its second relay: {ledger.by_relay(relays[1], start=1020.0)}")
+
+    print("\n--- Reopen after a torn write ---")
+    ledger.close()
+    tail = max(name for name in os.listdir(directory) if name.endswith(".seg"))
+    with open(os.path.join(directory, tail), "ab") as segment_file:
+        segment_file.write(b"\x00\x01partial")
+    reopened = ProofLedger(directory)
+    print(f"Recovered {len(reopened):,} proofs; MSG_66666 has {len(reopened.by_message('MSG_66666'))} proofs, "
+          f"MSG_PATH names {len(reopened.by_message('MSG_PATH')[0].relay_public_key)} relays")
+    reopened.close()
@@ -2,11 +2,17 @@
 # Conceptual Pythonic Stub for Proof-of-Relay Protocol
 # This code illustrates the logic and would be integrated into BitChat's Swift codebase.
 
+import threading
 import time
 import hashlib
+import hmac
 import json
+from collections import OrderedDict
 
-class MockCryptoEngine:
+from batch_pool import ChunkedThreadPool
+from mesh_crypto import CryptoEngine, key_label
+
+class MockCryptoEngine(CryptoEngine):
     """A mock cryptographic engine for signing and verification."""
     def sign(self, data: str, private_key: str) -> str:
         # In a real scenario, this would be a robust cryptographic signature
@@ -18,11 +24,46 @@ class MockCryptoEngine:
         return expected_signature == signature
 
 class ProofOfRelayProtocol:
-    """Conceptual implementation of a Proof-of-Relay protocol for mesh nodes."""
-    def __init__(self, crypto_engine: MockCryptoEngine, my_private_key: str, my_public_key: str):
+    """Conceptual implementation of a Proof-of-Relay protocol for mesh nodes.
+
+    Besides per-relay signatures, relays can extend a proof chain: a fixed-size
+    running MAC that each relay folds itself into under the proof key of its
+    hop of an onion circuit (see onion_circuits). Only the circuit's origin
+    holds every hop key, so it is the verifier; relays never learn who the
+    final recipient is. The origin checks the whole path with one comparison
+    against a value it recomputes with one HMAC per hop, instead of receiving
+    and verifying one signature per hop.
+
+    Chain proofs only convince the origin itself. For audits, the origin signs
+    an attestation of the relay path it verified, which anyone holding its
+    public key can check later.
+
+    Signatures that verified are remembered by digest in an LRU cache, so a
+    proof seen again (a retried message, or one that arrived over several
+    paths) costs a hash lookup instead of an Ed25519 verification.
+
+    Args:
+        crypto_engine: Engine providing sign/verify_signature.
+        my_private_key: This node's private key.
+        my_public_key: This node's public key.
+        verbose: Print a line per proof generated, verified or attested.
+        max_workers: Thread pool size for verify_many (None: Python's default).
+        cache_size: Number of verified proof digests kept.
+    """
+    CHAIN_SIZE = 32
+
+    def __init__(self, crypto_engine: CryptoEngine, my_private_key, my_public_key, verbose=True,
+                 max_workers=None, cache_size=65536):
         self.crypto = crypto_engine
         self.my_private_key = my_private_key
         self.my_public_key = my_public_key
+        self.verbose = verbose
+        self.cache_size = cache_size
+        self._verified = OrderedDict()   # proof digest -> None, least recently used first
+        self._lock = threading.Lock()
+        self._pool = ChunkedThreadPool(max_workers, thread_name_prefix="proof")
+        self.cache_hits = 0
+        self.signature_checks = 0
 
     def create_relay_proof_requirement(self, message_id: str) -> dict:
         """Creates a requirement for a relay proof to be included in a message.
@@ -34,31 +75,154 @@ class ProofOfRelayProtocol:
             "timestamp": time.time()
         }
 
+    @staticmethod
+    def _signed_data(message_id: str, public_key) -> str:
+        return f"{message_id}:{public_key if isinstance(public_key, str) else public_key.hex()}"
+
     def generate_relay_proof(self, message_id: str) -> str:
         """Generates a cryptographic proof that this node relayed the message.
         The proof is a signature over the message's unique ID and the relaying node's ID/timestamp.
         """
         # For a real system, the payload or a hash of it would be included in the signed data.
         # For this mock, we'll simplify the signed data to just message_id and public_key.
-        data_to_sign = f"{message_id}:{self.my_public_key}"
+        data_to_sign = self._signed_data(message_id, self.my_public_key)
         proof = self.crypto.sign(data_to_sign, self.my_private_key)
-        print(f"[Node {self.my_public_key.replace('pub_', '')}] Generated proof for message {message_id}")
+        if self.verbose:
+            print(f"[Node {key_label(self.my_public_key)}] Generated proof for message {message_id}")
         return proof
 
     def verify_relay_proof(self, relay_public_key: str, proof: str, message_id: str) -> bool:
         """Verifies a relay proof against the expected data and public key.
         This would be done by the next hop or the final recipient.
         """
+        is_verified = self._check_proof(relay_public_key, proof, message_id)
+        if self.verbose:
+            outcome = "Successfully verified" if is_verified else "Failed to verify"
+            print(f"[Verifier] {outcome} proof from {key_label(relay_public_key)} for message {message_id}")
+        return is_verified
+
+    def verify_many(self, proofs) -> list:
+        """Verifies a batch of (relay_public_key, proof, message_id) tuples; returns one bool per tuple.
+
+        Cached and duplicate proofs are resolved by digest first; only the
+        remaining distinct proofs are verified, across the thread pool.
+        """
+        proofs = list(proofs)
+        digests = [self._proof_digest(*item) for item in proofs]
+        results = [None] * len(proofs)
+        pending = {}   # digest -> index of its first occurrence
+        with self._lock:
+            for index, digest in enumerate(digests):
+                if digest in self._verified:
+                    self._verified.move_to_end(digest)
+                    self.cache_hits += 1
+                    results[index] = True
+                elif digest in pending:
+                    self.cache_hits += 1
+                else:
+                    pending[digest] = index
+        items = [(digest, proofs[index]) for digest, index in pending.items()]
+        outcomes = dict(zip(pending, self._pool.map_chunks(lambda item: self._check_proof(*item[1], digest=item[0]), items)))
+        for index, digest in enumerate(digests):
+            if results[index] is None:
+                results[index] = outcomes[digest]
+        if self.verbose:
+            print(f"[Verifier] Batch of {len(proofs)} proofs: {sum(results)} verified, "
+                  f"{len(pending)} signature checks")
+        return results
+
+    def _proof_digest(self, relay_public_key, proof, message_id) -> bytes:
+        signed = self._signed_data(message_id, relay_public_key).encode()
+        proof = proof.encode() if isinstance(proof, str) else bytes(proof)
+        return hashlib.blake2b(len(signed).to_bytes(4, "big") + signed + proof, digest_size=16).digest()
+
+    def _check_proof(self, relay_public_key, proof, message_id, digest=None) -> bool:
+        """Cache lookup, then signature verification; only proofs that verified are cached."""
+        digest = digest or self._proof_digest(relay_public_key, proof, message_id)
+        with self._lock:
+            if digest in self._verified:
+                self._verified.move_to_end(digest)
+                self.cache_hits += 1
+                return True
         # Reconstruct the data that was signed by the relay for verification
-        data_signed_by_relay = f"{message_id}:{relay_public_key}"
-        
+        data_signed_by_relay = self._signed_data(message_id, relay_public_key)
         is_verified = self.crypto.verify_signature(data_signed_by_relay, proof, relay_public_key)
-        if is_verified:
-            print(f"[Verifier] Successfully verified proof from {relay_public_key.replace('pub_', '')} for message {message_id}")
-        else:
-            print(f"[Verifier] Failed to verify proof from {relay_public_key.replace('pub_', '')} for message {message_id}")
+        with self._lock:
+            self.signature_checks += 1
+            if is_verified:
+                self._verified[digest] = None
+                if len(self._verified) > self.cache_size:
+                    self._verified.popitem(last=False)
         return is_verified
 
+    def close(self):
+        """Shuts down the verify_many thread pool, if one was started."""
+        self._pool.close()
+
+    # --- Hash-chain proofs ---
+    def start_proof_chain(self, message_id: str) -> bytes:
+        """The chain value a message leaves its sender with, before any relay has touched it."""
+        return hashlib.sha256(b"bitchat-relay-chain:" + message_id.encode()).digest()
+
+    def _chain_step(self, key, message_id: str, chain: bytes) -> bytes:
+        return hmac.digest(key, chain + message_id.encode(), "sha256")
+
+    def extend_proof_chain(self, message_id: str, chain: bytes, hop_key: bytes) -> bytes:
+        """Folds this relay into the chain; the result replaces the chain carried with the message.
+
+        hop_key is the proof key of the circuit hop the message arrived on
+        (CircuitRelay.proof_key). Each step MACs the previous value, so the
+        final chain commits to every relay in order and is still CHAIN_SIZE
+        bytes however long the path is.
+        """
+        chain = self._chain_step(hop_key, message_id, chain)
+        if self.verbose:
+            print(f"[Node {key_label(self.my_public_key)}] Extended proof chain for message {message_id}")
+        return chain
+
+    def expected_proof_chain(self, message_id: str, hop_keys) -> bytes:
+        """The chain the origin should get back if exactly the hops keyed by hop_keys relayed the message, in order.
+
+        The origin knows its circuit's hop keys (OnionCircuit.proof_keys), so it
+        can compute this before the message is even sent, leaving a single
+        comparison on the receive path.
+        """
+        chain = self.start_proof_chain(message_id)
+        for hop_key in hop_keys:
+            chain = self._chain_step(hop_key, message_id, chain)
+        return chain
+
+    def verify_proof_chain(self, message_id: str, chain: bytes, hop_keys) -> bool:
+        """Verifies in one pass that every hop keyed by hop_keys handled the message, in that order."""
+        hop_keys = list(hop_keys)
+        is_verified = hmac.compare_digest(self.expected_proof_chain(message_id, hop_keys), chain)
+        if self.verbose:
+            outcome = "Successfully verified" if is_verified else "Failed to verify"
+            print(f"[Verifier] {outcome} proof chain over {len(hop_keys)} relays for message {message_id}")
+        return is_verified
+
+    # --- Audit attestations ---
+    @staticmethod
+    def _attested_data(message_id: str, relay_public_keys) -> str:
+        keys = ",".join(key if isinstance(key, str) else key.hex() for key in relay_public_keys)
+        return f"relayed:{message_id}:{keys}"
+
+    def attest_relay_path(self, message_id: str, relay_public_keys):
+        """Signs that relay_public_keys relayed message_id, in that order, after a chain check succeeded.
+
+        Unlike the chain itself, the attestation can be checked by a third party
+        (an auditor) with this node's public key.
+        """
+        attestation = self.crypto.sign(self._attested_data(message_id, relay_public_keys), self.my_private_key)
+        if self.verbose:
+            print(f"[Node {key_label(self.my_public_key)}] Attested relay path of message {message_id}")
+        return attestation
+
+    def verify_attestation(self, attester_public_key, attestation, message_id: str, relay_public_keys) -> bool:
+        """Checks an attestation made by attest_relay_path on attester_public_key's node."""
+        return self.crypto.verify_signature(self._attested_data(message_id, relay_public_keys), attestation,
+                                            attester_public_key)
+
 # Example Usage:
 if __name__ == "__main__":
     class MockNode:
@@ -122,5 +286,99 @@ if __name__ == "__main__":
     )
     print(f"Fake proof verified (should be False): {is_fake_proof_verified}")
 
+    print("\n--- Hash-Chain Proof over a circuit ---")
+    import os
+    from mesh_crypto import AeadCryptoEngine
+    from onion_circuits import CircuitManager, CircuitRelay
+
+    # The sender sets up a circuit through two relays to the recipient; every hop gets its own proof key.
+    circuit_keys = [AeadCryptoEngine.generate_keypair() for _ in range(3)]
+    circuit_relays = [CircuitRelay(private_key) for private_key, _ in circuit_keys]
+    circuit, [(_, cell)] = CircuitManager().circuit_for([public_key for _, public_key in circuit_keys])
+    for circuit_relay in circuit_relays:
+        _, cell, _, _ = circuit_relay.handle_cell(cell)
+
+    # Each relay extends the running chain with its hop's key; only one fixed-size value travels with the message.
+    chain = sender.proof_protocol.start_proof_chain(message_id)
+    for hop, relay in enumerate((relay1, relay2)):
+        chain = relay.proof_protocol.extend_proof_chain(
+            message_id, chain, circuit_relays[hop].proof_key(circuit.circuit_ids[hop]))
+    relay_keys = circuit.proof_keys[:2]
+    print(f"Chain verified by the sender: {sender.proof_protocol.verify_proof_chain(message_id, chain, relay_keys)}")
+    print(f"Chain with Relay1 skipped verified (should be False): "
+          f"{sender.proof_protocol.verify_proof_chain(message_id, chain, relay_keys[1:])}")
+    print(f"Chain with relays swapped verified (should be False): "
+          f"{sender.proof_protocol.verify_proof_chain(message_id, chain, relay_keys[::-1])}")
+
+    # The sender's signed attestation is what an auditor can check later.
+    attestation = sender.proof_protocol.attest_relay_path(message_id, [relay1.public_key, relay2.public_key])
+    print(f"Auditor accepts the sender's attestation: "
+          f"{final_recipient.proof_protocol.verify_attestation(sender.public_key, attestation, message_id, [relay1.public_key, relay2.public_key])}")
+    print(f"Attestation with relays swapped accepted (should be False): "
+          f"{final_recipient.proof_protocol.verify_attestation(sender.public_key, attestation, message_id, [relay2.public_key, relay1.public_key])}")
+
+    print("\n--- Proof size and cold verification cost vs. hop count ---")
+
+    def real_protocol(cache_size=65536):
+        private_key, public_key = AeadCryptoEngine.generate_keypair()
+        return ProofOfRelayProtocol(AeadCryptoEngine(private_key), private_key, public_key, verbose=False,
+                                    cache_size=cache_size)
+
+    # No verified-signature cache, so every round is a first sight; the chain has no cache to begin with.
+    verifier = real_protocol(cache_size=0)
+    relays = [real_protocol() for _ in range(8)]
+    hop_keys = [os.urandom(32) for _ in relays]   # the circuit's per-hop proof keys, agreed at setup
+    rounds = 2000
+    for hops in (1, 2, 4, 8):
+        path = relays[:hops]
+        keys = [relay.my_public_key for relay in path]
+        signatures = [relay.generate_relay_proof(message_id) for relay in path]
+        chain = verifier.start_proof_chain(message_id)
+        for relay, hop_key in zip(path, hop_keys):
+            chain = relay.extend_proof_chain(message_id, chain, hop_key)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            signatures_ok = all(verifier.verify_relay_proof(key, proof, message_id) for key, proof in zip(keys, signatures))
+        signature_time = (time.perf_counter() - start) / rounds
+        start = time.perf_counter()
+        for _ in range(rounds):
+            chain_ok = verifier.verify_proof_chain(message_id, chain, hop_keys[:hops])
+        chain_time = (time.perf_counter() - start) / rounds
+        expected = verifier.expected_proof_chain(message_id, hop_keys[:hops])
+        start = time.perf_counter()
+        for _ in range(rounds):
+            precomputed_ok = hmac.compare_digest(expected, chain)
+        precomputed_time = (time.perf_counter() - start) / rounds
+        assert signatures_ok and chain_ok and precomputed_ok and verifier.cache_hits == 0
+        print(f"{hops} relays: signatures {sum(map(len, signatures)):4d} B, verify {signature_time * 1e6:6.1f} us | "
+              f"chain {len(chain)} B, verify {chain_time * 1e6:5.1f} us, precomputed {precomputed_time * 1e6:.2f} us")
+
+    print("\n--- Base-station batch verification ---")
+    # 2,000 distinct proofs, each delivered twice (retries and multipath), verified in batches.
+    relay_keys = [AeadCryptoEngine.generate_keypair() for _ in range(50)]
+    signer = AeadCryptoEngine()
+    distinct = []
+    for i in range(2000):
+        private_key, public_key = relay_keys[i % len(relay_keys)]
+        distinct.append((public_key, signer.sign(ProofOfRelayProtocol._signed_data(f"MSG_{i}", public_key), private_key), f"MSG_{i}"))
+    traffic = distinct + distinct
+    forged = (relay_keys[0][1], bytes(64), "MSG_0")
 
+    start = time.perf_counter()
+    looped = [signer.verify_signature(ProofOfRelayProtocol._signed_data(message_id, key), proof, key)
+              for key, proof, message_id in traffic]
+    loop_time = time.perf_counter() - start
 
+    base_station = real_protocol()
+    start = time.perf_counter()
+    batched = base_station.verify_many(traffic + [forged])
+    batch_time = time.perf_counter() - start
+    start = time.perf_counter()
+    repeated = base_station.verify_many(traffic)
+    repeat_time = time.perf_counter() - start
+    assert batched[:-1] == looped and all(repeated) and not batched[-1]
+    print(f"{len(traffic)} proofs, one signature check each: {len(traffic) / loop_time:,.0f} proofs/s")
+    print(f"verify_many, first sight: {len(traffic) / batch_time:,.0f} proofs/s "
+          f"({base_station.signature_checks} signature checks, forged proof rejected)")
+    print(f"verify_many, all cached: {len(traffic) / repeat_time:,.0f} proofs/s, cache hits: {base_station.cache_hits}")
+    base_station.close()
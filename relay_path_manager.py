@@ -1,27 +1,159 @@
-
 # Conceptual Pythonic Stub for RelayPathManager
 # This code illustrates the logic and would be integrated into BitChat's Swift codebase.
 
 import time
 import random
+import numpy as np
 
 class NetworkMonitor:
-    """Mock class to simulate network monitoring for path scoring metrics."""
+    """Mock class to simulate network monitoring for path scoring metrics.
+
+    When a PathMetricsStore is attached, observed EWMA metrics take precedence
+    over the simulated values for any path (or set of links) that has history.
+    When a RelayReputation is attached, the security score is the trust of the
+    path's least trusted relay, learned from proof-of-relay outcomes.
+    """
+    def __init__(self, metrics_store=None, reputation=None):
+        self.metrics_store = metrics_store
+        self.reputation = reputation
+
     def get_reliability(self, nodes): 
+        observed = self._observed(nodes)
+        if observed is not None and observed[0] is not None:
+            return observed[0]
         # Simulate some variability
         return 0.8 + (random.random() * 0.2)
     def get_security_score(self, nodes): 
+        if self.reputation is not None:
+            return float(self.reputation.path_trust([nodes])[0])
         # Higher score for fewer hops, trusted nodes
         return 1.0 - (len(nodes) * 0.1) # Max 1.0, min 0.0
     def get_latency(self, nodes): 
+        observed = self._observed(nodes)
+        if observed is not None and observed[1] is not None:
+            return observed[1]
         return 50 * len(nodes) + random.randint(0, 20) # ms per hop
     def get_bandwidth(self, nodes): 
+        observed = self._observed(nodes)
+        if observed is not None and observed[2] is not None:
+            return observed[2]
         return 1000 - (len(nodes) * 50) # kbps, less for more hops
 
+    def record_observation(self, path, success=True, observed_latency=None, observed_bandwidth=None,
+                           proof_verified=None, suspects=None):
+        """Feeds an observed delivery outcome back into the metrics store, if any.
+
+        proof_verified is the outcome of the path's proof-of-relay check (None if
+        there was none); it updates the relays' reputation when one is attached.
+        suspects narrows a failed check down to the relays that could have caused
+        it (default: every relay on the path).
+        """
+        if self.metrics_store is not None:
+            self.metrics_store.record_path(path, success, observed_latency, observed_bandwidth)
+        if self.reputation is not None and proof_verified is not None:
+            self.reputation.record_path(path[1:-1] if suspects is None else suspects, proof_verified)
+
+    def _observed(self, nodes, lookup=None):
+        """(reliability, latency, bandwidth) from history, or None if the path is unknown.
+
+        The path's own entry is preferred; otherwise the metrics are composed from
+        its links when every link has history. lookup maps a store key to its
+        metrics (default: the store's get).
+        """
+        store = self.metrics_store
+        if store is None or len(nodes) < 2:
+            return None
+        lookup = lookup or store.get
+        metrics = lookup(store.path_key(nodes))
+        if metrics is not None:
+            return metrics.reliability, metrics.latency, metrics.bandwidth
+
+        reliability, latency, bandwidth = 1.0, 0.0, float("inf")
+        latency_seen = False
+        for u, v in zip(nodes, nodes[1:]):
+            link = lookup(store.link_key(u, v))
+            if link is None:
+                return None
+            reliability *= link.reliability if link.reliability is not None else 1.0
+            if link.latency is not None:
+                latency += link.latency
+                latency_seen = True
+            if link.bandwidth is not None:
+                bandwidth = min(bandwidth, link.bandwidth)
+        return reliability, latency if latency_seen else None, bandwidth if bandwidth != float("inf") else None
+
+    def get_path_metrics_batch(self, paths):
+        """Path-level metrics for many paths at once, as NumPy arrays.
+
+        Returns (reliability, security_level, latency, bandwidth, hop_count), each of
+        shape (len(paths),), following the same models as the per-path getters.
+        """
+        hop_count = np.fromiter((len(path) for path in paths), dtype=np.float64, count=len(paths))
+        reliability = 0.8 + np.random.random(len(paths)) * 0.2
+        security_level = self.reputation.path_trust(paths) if self.reputation is not None else 1.0 - hop_count * 0.1
+        latency = 50 * hop_count + np.random.randint(0, 21, size=len(paths))
+        bandwidth = 1000 - hop_count * 50
+
+        store = self.metrics_store
+        if store is not None:
+            # One query for every path and link entry not already in memory.
+            keys = []
+            for path in paths:
+                if len(path) >= 2:
+                    keys.append(store.path_key(path))
+                    keys.extend(store.link_key(u, v) for u, v in zip(path, path[1:]))
+            known = store.get_many(keys)
+            for i, path in enumerate(paths):
+                observed = self._observed(path, known.get)
+                if observed is None:
+                    continue
+                if observed[0] is not None:
+                    reliability[i] = observed[0]
+                if observed[1] is not None:
+                    latency[i] = observed[1]
+                if observed[2] is not None:
+                    bandwidth[i] = observed[2]
+        return reliability, security_level, latency, bandwidth, hop_count
+
 class RelayPathManager:
     """Manages the selection and scoring of relay paths within the mesh network."""
-    def __init__(self, network_monitor):
+    # Weights for scoring criteria (can be tuned)
+    SCORE_WEIGHTS = {
+        "reliability": 0.3,   # Historical success rate
+        "security": 0.25,     # Trust score of relay nodes
+        "latency": 0.2,       # Speed (inverse of latency)
+        "bandwidth": 0.15,    # Available throughput
+        "hop_count": 0.1,     # Fewer hops preferred
+    }
+
+    def __init__(self, network_monitor, path_engine=None, route_cache=None):
         self.network_monitor = network_monitor
+        self.path_engine = path_engine # e.g. KShortestPathsEngine; required for discover_paths
+        self.route_cache = route_cache # optional RouteCache consulted by get_routes
+
+    def get_routes(self, source_id, destination_id, num_paths=1, max_candidates=5):
+        """Returns the selected paths (lists of node IDs) between two nodes.
+
+        Served from the route cache when possible; otherwise runs discovery and
+        scoring and caches the result under the pair and the selection parameters.
+        """
+        variant = (num_paths, max_candidates)
+        if self.route_cache is not None:
+            cached = self.route_cache.get(source_id, destination_id, variant)
+            if cached is not None:
+                return cached
+
+        candidates = self.discover_paths(source_id, destination_id, max_paths=max_candidates)
+        selected = self.select_optimal_paths(candidates, num_paths=num_paths)
+        if self.route_cache is not None and selected:
+            self.route_cache.put(source_id, destination_id, selected, variant)
+        return selected
+
+    def discover_paths(self, source_id, destination_id, max_paths=5, max_hops=None):
+        """Returns up to max_paths loopless candidate paths (lists of node IDs), shortest first."""
+        if self.path_engine is None:
+            return []
+        return self.path_engine.shortest_paths(source_id, destination_id, k=max_paths, max_hops=max_hops)
 
     def calculate_path_score(self, path_nodes):
         """Scores a given path based on various metrics."""
@@ -34,49 +166,147 @@ class RelayPathManager:
         bandwidth = self.network_monitor.get_bandwidth(path_nodes)
         hop_count = len(path_nodes)
 
-        # Weights for scoring criteria (can be tuned)
+        w = self.SCORE_WEIGHTS
         score = (
-            reliability * 0.3 +        # Historical success rate
-            security_level * 0.25 +    # Trust score of relay nodes
-            (1.0 / (latency + 1)) * 0.2 + # Speed (inverse of latency, +1 to avoid div by zero)
-            bandwidth * 0.15 +          # Available throughput
-            (1.0 / (hop_count + 1)) * 0.1 # Fewer hops preferred, +1 to avoid div by zero
+            reliability * w["reliability"] +
+            security_level * w["security"] +
+            (1.0 / (latency + 1)) * w["latency"] + # +1 to avoid div by zero
+            bandwidth * w["bandwidth"] +
+            (1.0 / (hop_count + 1)) * w["hop_count"] # +1 to avoid div by zero
         )
         return score
 
-    def select_optimal_paths(self, all_possible_paths, num_paths=3):
-        """Selects the top N optimal paths, with consideration for diversity."""
+    def score_paths_batch(self, reliability, security_level, latency, bandwidth, hop_count):
+        """Vectorized calculate_path_score over arrays of path-level metrics.
+
+        Paths with a hop_count of zero (empty paths) score 0.0.
+        """
+        w = self.SCORE_WEIGHTS
+        hop_count = np.asarray(hop_count, dtype=np.float64)
+        scores = (
+            np.asarray(reliability, dtype=np.float64) * w["reliability"] +
+            np.asarray(security_level, dtype=np.float64) * w["security"] +
+            w["latency"] / (np.asarray(latency, dtype=np.float64) + 1) +
+            np.asarray(bandwidth, dtype=np.float64) * w["bandwidth"] +
+            w["hop_count"] / (hop_count + 1)
+        )
+        return np.where(hop_count > 0, scores, 0.0)
+
+    def score_hop_metrics(self, hop_reliability, hop_security, hop_latency, hop_bandwidth, hop_counts):
+        """Scores many paths from padded (num_paths, max_hops) arrays of per-hop metrics.
+
+        Path reliability is the product of hop reliabilities, latency is the sum, and
+        security and bandwidth are the bottleneck (minimum) hop. Entries at or beyond
+        hop_counts[i] in row i are padding and ignored.
+        """
+        hop_counts = np.asarray(hop_counts)
+        hop_reliability = np.asarray(hop_reliability, dtype=np.float64)
+        mask = np.arange(hop_reliability.shape[1]) < hop_counts[:, None]
+
+        reliability = np.where(mask, hop_reliability, 1.0).prod(axis=1)
+        security_level = np.where(mask, hop_security, np.inf).min(axis=1)
+        latency = np.where(mask, hop_latency, 0.0).sum(axis=1)
+        bandwidth = np.where(mask, hop_bandwidth, np.inf).min(axis=1)
+
+        # A path of h hops visits h + 1 nodes, matching len(path_nodes) in calculate_path_score.
+        node_counts = np.where(hop_counts > 0, hop_counts + 1, 0)
+        return self.score_paths_batch(reliability, security_level, latency, bandwidth, node_counts)
+
+    @staticmethod
+    def top_n_indices(scores, num_paths):
+        """Indices of the num_paths highest scores, best first.
+
+        Uses partial selection (argpartition) so only the selected slice is sorted.
+        """
+        scores = np.asarray(scores)
+        if num_paths <= 0 or scores.size == 0:
+            return np.empty(0, dtype=np.intp)
+        if num_paths < scores.size:
+            top = np.argpartition(-scores, num_paths - 1)[:num_paths]
+        else:
+            top = np.arange(scores.size)
+        return top[np.argsort(-scores[top], kind="stable")]
+
+    def select_optimal_paths(self, all_possible_paths, num_paths=3, diverse=True):
+        """Selects the top N optimal paths, with consideration for diversity.
+
+        With diverse=True, paths are chosen to be as node-disjoint as possible
+        (see select_diverse_paths); otherwise the N highest scores are returned.
+        """
         if not all_possible_paths:
             return []
 
-        scored_paths = []
-        for path in all_possible_paths:
-            score = self.calculate_path_score(path)
-            scored_paths.append((path, score))
-        
-        # Sort by score in descending order
-        scored_paths.sort(key=lambda x: x[1], reverse=True)
-        
-        # Simple selection of top N paths. 
-        # Real diversity logic would be more complex, e.g., avoiding paths with common intermediate nodes.
-        selected_paths = []
-        for path, score in scored_paths:
-            if len(selected_paths) < num_paths:
-                selected_paths.append(path)
-            else:
-                break # We have enough paths
-        
-        return selected_paths
-
-    def update_path_metrics(self, path, success=True, observed_latency=None, observed_bandwidth=None):
+        # Score every candidate in one vectorized pass.
+        metrics = self.network_monitor.get_path_metrics_batch(all_possible_paths)
+        scores = self.score_paths_batch(*metrics)
+
+        # Route around relays whose reputation fell below the trust floor, unless no path avoids them.
+        reputation = getattr(self.network_monitor, "reputation", None)
+        if reputation is not None:
+            trusted = metrics[1] >= reputation.min_trust
+            if trusted.any() and not trusted.all():
+                keep = np.flatnonzero(trusted)
+                all_possible_paths = [all_possible_paths[i] for i in keep]
+                scores = scores[keep]
+
+        if diverse and num_paths > 1:
+            return [all_possible_paths[i] for i in self.select_diverse_paths(all_possible_paths, scores, num_paths)]
+        return [all_possible_paths[i] for i in self.top_n_indices(scores, num_paths)]
+
+    @staticmethod
+    def select_diverse_paths(paths, scores, num_paths):
+        """Greedily picks indices of num_paths high-scoring, maximally node-disjoint paths.
+
+        Each path's relays (every node except the two endpoints) are encoded as an
+        integer bitset. Each round takes the candidate with the fewest relays in
+        common with those already selected, breaking ties by score, so a shared
+        relay is only accepted when no fully disjoint path is left.
+        """
+        bit_of = {}
+        masks = []
+        for path in paths:
+            mask = 0
+            for node in path[1:-1]:
+                node_id = getattr(node, "id", node)
+                bit = bit_of.get(node_id)
+                if bit is None:
+                    bit = bit_of[node_id] = len(bit_of)
+                mask |= 1 << bit
+            masks.append(mask)
+
+        order = np.argsort(-np.asarray(scores), kind="stable").tolist()
+        selected = []
+        used = 0
+        while order and len(selected) < num_paths:
+            best_pos, best_overlap = 0, None
+            for pos, i in enumerate(order):
+                overlap = bin(masks[i] & used).count("1")
+                if best_overlap is None or overlap < best_overlap:
+                    best_pos, best_overlap = pos, overlap
+                    if overlap == 0:
+                        break # Candidates are in score order, so the first disjoint one wins.
+            i = order.pop(best_pos)
+            selected.append(i)
+            used |= masks[i]
+        return selected
+
+    def update_path_metrics(self, path, success=True, observed_latency=None, observed_bandwidth=None,
+                            proof_verified=None, suspects=None):
         """Updates historical metrics for a path based on observed performance.
-        (Conceptual - actual implementation would involve persistent storage and aggregation)"""
+        The observation is folded into the monitor's PathMetricsStore and relay
+        reputation (when attached), influencing future calculate_path_score and
+        select_optimal_paths calls."""
         print(f"[RelayPathManager] Updating metrics for path: {path} - Success: {success}")
-        # In a real system, this would update a database or a local cache
-        # of path performance, influencing future calculate_path_score calls.
+        self.network_monitor.record_observation(path, success, observed_latency, observed_bandwidth, proof_verified,
+                                                suspects)
+        if (not success or proof_verified is False) and self.route_cache is not None:
+            # Cached routes over these links are suspect; re-select on next use.
+            self.route_cache.invalidate_path([getattr(node, "id", node) for node in path])
 
 # Example Usage:
 if __name__ == "__main__":
+    from path_metrics_store import PathMetricsStore
+
     # Mock nodes (representing drone IDs or network addresses)
     class MockNode:
         def __init__(self, id):
@@ -98,7 +328,7 @@ if __name__ == "__main__":
         [node_a, node_b, node_d, node_e, node_c] # Path 4 (longer)
     ]
 
-    network_monitor = NetworkMonitor()
+    network_monitor = NetworkMonitor(PathMetricsStore())
     path_manager = RelayPathManager(network_monitor)
 
     print("--- Scoring Paths ---")
@@ -106,13 +336,52 @@ if __name__ == "__main__":
         score = path_manager.calculate_path_score(path)
         print(f"Path: {[n.id for n in path]}, Score: {score:.2f}")
 
+    print("\n--- Batch Scoring (20,000 candidates) ---")
+    num_candidates, max_hops = 20000, 8
+    hop_counts = np.random.randint(1, max_hops + 1, size=num_candidates)
+    start = time.perf_counter()
+    batch_scores = path_manager.score_hop_metrics(
+        np.random.uniform(0.9, 1.0, (num_candidates, max_hops)),   # per-hop reliability
+        np.random.uniform(0.5, 1.0, (num_candidates, max_hops)),   # per-hop security
+        np.random.uniform(20, 80, (num_candidates, max_hops)),     # per-hop latency (ms)
+        np.random.uniform(200, 1000, (num_candidates, max_hops)),  # per-hop bandwidth (kbps)
+        hop_counts
+    )
+    best = path_manager.top_n_indices(batch_scores, 5)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"Scored {num_candidates} paths in {elapsed_ms:.2f} ms. Best indices: {best.tolist()}")
+
     print("\n--- Selecting Optimal Paths (Top 2) ---")
     optimal_paths = path_manager.select_optimal_paths(all_paths, num_paths=2)
     for path in optimal_paths:
         print(f"Selected Path: {[n.id for n in path]}")
 
+    print("\n--- Diverse vs. Plain Top-3 ---")
+    for diverse in (False, True):
+        selected = path_manager.select_optimal_paths(all_paths, num_paths=3, diverse=diverse)
+        print(f"diverse={diverse}: {[[n.id for n in path] for path in selected]}")
+
     # Simulate updating metrics after a transmission
     path_manager.update_path_metrics(optimal_paths[0], success=True, observed_latency=150)
     path_manager.update_path_metrics(all_paths[3], success=False)
 
+    print("\n--- Scores After Feedback ---")
+    for path in (optimal_paths[0], all_paths[3]):
+        score = path_manager.calculate_path_score(path)
+        print(f"Path: {[n.id for n in path]}, Score: {score:.2f}")
+
+    print("\n--- Routing Around a Distrusted Relay ---")
+    from relay_reputation import RelayReputation
+
+    reputation_monitor = NetworkMonitor(PathMetricsStore(), RelayReputation())
+    reputation_manager = RelayPathManager(reputation_monitor)
+    candidates = all_paths[:2]   # via B or via D
+    print(f"Before: {[n.id for n in reputation_manager.select_optimal_paths(candidates, num_paths=1)[0]]}")
+    for _ in range(3):
+        # Proof chains through B stop verifying.
+        reputation_manager.update_path_metrics(all_paths[0], success=True, proof_verified=False)
+    print(f"B trust: {reputation_monitor.reputation.trust('B'):.2f}, D trust: {reputation_monitor.reputation.trust('D'):.2f}, "
+          f"security score via B: {reputation_monitor.get_security_score(all_paths[0]):.2f}")
+    print(f"After: {[n.id for n in reputation_manager.select_optimal_paths(candidates, num_paths=1)[0]]}")
+
 
@@ -0,0 +1,167 @@
+# Relay reputation for the BitChat mesh.
+# Proof-of-relay outcomes are folded into exponentially decayed per-node trust,
+# which path scoring reads back so misbehaving relays are routed around.
+
+import math
+import time
+
+import numpy as np
+
+class RelayReputation:
+    """Decayed per-relay trust from proof-of-relay outcomes, O(1) per update.
+
+    Each node keeps decayed success and failure weights. Instead of decaying
+    every node on every update, weights are stored scaled by exp(t / tau)
+    relative to a common epoch: an update adds its weight times that factor,
+    and a lookup multiplies all stored weights by one shared exp(-now / tau).
+    Trust is the posterior mean (successes + prior_successes) /
+    (successes + failures + prior_successes + prior_failures), so unknown
+    nodes start at the prior and a few failures outweigh a long good history,
+    which fades with half_life anyway.
+
+    Lookups are vectorized over many nodes or whole paths, for batch path scoring.
+
+    Args:
+        half_life: Seconds after which an outcome counts half as much.
+        failure_weight: Weight of a failed proof relative to a successful one.
+        prior_successes: Pseudo-successes every node starts with.
+        prior_failures: Pseudo-failures every node starts with.
+        min_trust: Trust below which a relay is avoided by path selection.
+        clock: Time source in seconds.
+    """
+    RESCALE_EXPONENT = 50.0   # Re-base the epoch before exp(t / tau) can overflow.
+
+    def __init__(self, half_life=300.0, failure_weight=4.0, prior_successes=4.0, prior_failures=1.0,
+                 min_trust=0.5, clock=time.monotonic):
+        self.tau = half_life / math.log(2)
+        self.failure_weight = failure_weight
+        self.prior_successes = prior_successes
+        self.prior_failures = prior_failures
+        self.min_trust = min_trust
+        self.clock = clock
+        self._epoch = clock()
+        self._slots = {}   # node ID -> row; row 0 is reserved for unknown nodes and never updated
+        self._successes = np.zeros(64)
+        self._failures = np.zeros(64)
+        self.updates = 0
+
+    @property
+    def prior_trust(self):
+        return self.prior_successes / (self.prior_successes + self.prior_failures)
+
+    def _slot(self, node_id):
+        slot = self._slots.get(node_id)
+        if slot is None:
+            slot = self._slots[node_id] = len(self._slots) + 1
+            if slot >= len(self._successes):
+                self._successes = np.concatenate([self._successes, np.zeros(len(self._successes))])
+                self._failures = np.concatenate([self._failures, np.zeros(len(self._failures))])
+        return slot
+
+    def _scale(self, now):
+        """exp((now - epoch) / tau), re-basing the epoch (one O(n) pass) when it grows too large."""
+        exponent = (now - self._epoch) / self.tau
+        if exponent > self.RESCALE_EXPONENT:
+            decay = math.exp(-exponent)
+            self._successes *= decay
+            self._failures *= decay
+            self._epoch = now
+            exponent = 0.0
+        return math.exp(exponent)
+
+    # --- Updates ---
+    def record(self, node_id, success, weight=1.0):
+        """Folds one proof outcome for a relay into its trust."""
+        node_id = getattr(node_id, "id", node_id)
+        slot = self._slot(node_id)
+        scaled = weight * self._scale(self.clock())
+        if success:
+            self._successes[slot] += scaled
+        else:
+            self._failures[slot] += scaled * self.failure_weight
+        self.updates += 1
+
+    def record_path(self, relays, success):
+        """Outcome of a proof chain over relays: a failure cannot tell which relay broke
+        the chain, so the blame is split between them."""
+        if not relays:
+            return
+        weight = 1.0 if success else 1.0 / len(relays)
+        for relay in relays:
+            self.record(relay, success, weight)
+
+    # --- Lookups ---
+    def _trust_of_slots(self, slots):
+        decay = 1.0 / self._scale(self.clock())
+        successes = self._successes[slots] * decay + self.prior_successes
+        failures = self._failures[slots] * decay + self.prior_failures
+        return successes / (successes + failures)
+
+    def trust(self, node_id) -> float:
+        return float(self._trust_of_slots(self._slots.get(getattr(node_id, "id", node_id), 0)))
+
+    def trust_many(self, node_ids) -> np.ndarray:
+        """Trust of each node, as an array; unknown nodes get the prior."""
+        slots = np.fromiter((self._slots.get(getattr(node, "id", node), 0) for node in node_ids), dtype=np.intp)
+        return self._trust_of_slots(slots)
+
+    def path_trust(self, paths) -> np.ndarray:
+        """Bottleneck (minimum) relay trust of each path; endpoints are not relays.
+
+        Paths without relays get 1.0. One gather and one reduceat over all relays of all paths.
+        """
+        lengths = np.fromiter((max(len(path) - 2, 0) for path in paths), dtype=np.intp, count=len(paths))
+        result = np.ones(len(paths))
+        if not lengths.any():
+            return result
+        trust = self.trust_many(node for path in paths for node in path[1:-1])
+        has_relays = lengths > 0
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))[has_relays]
+        result[has_relays] = np.minimum.reduceat(trust, starts)
+        return result
+
+    def avoided(self):
+        """Node IDs currently below min_trust."""
+        nodes = list(self._slots)
+        return [node for node, trust in zip(nodes, self.trust_many(nodes)) if trust < self.min_trust]
+
+    def __len__(self):
+        return len(self._slots)
+
+# Example Usage:
+if __name__ == "__main__":
+    now = [0.0]
+    reputation = RelayReputation(half_life=300.0, clock=lambda: now[0])
+
+    print("--- Update and lookup cost ---")
+    node_ids = [f"Drone{i}" for i in range(2000)]
+    rng = np.random.default_rng(7)
+    outcomes = rng.random(200000) < 0.95
+    relays = rng.integers(0, len(node_ids), size=len(outcomes))
+    start = time.perf_counter()
+    for i, (relay, success) in enumerate(zip(relays.tolist(), outcomes.tolist())):
+        now[0] = i * 0.01
+        reputation.record(node_ids[relay], success)
+    elapsed = time.perf_counter() - start
+    print(f"{len(outcomes):,} outcomes over {now[0]:.0f} simulated s: {elapsed / len(outcomes) * 1e6:.2f} us per update")
+    paths = [["GS"] + [node_ids[j] for j in rng.integers(0, len(node_ids), size=rng.integers(1, 7))] + ["BaseStation"]
+             for _ in range(20000)]
+    start = time.perf_counter()
+    bottlenecks = reputation.path_trust(paths)
+    print(f"Bottleneck trust of {len(paths):,} paths in {(time.perf_counter() - start) * 1000:.1f} ms "
+          f"(mean {bottlenecks.mean():.3f})")
+
+    print("\n--- A relay turns malicious ---")
+    # Drone7 relays about 5 proofs per second; from t0 on its proof chains stop verifying.
+    t0 = now[0]
+    print(f"Drone7 trust before: {reputation.trust('Drone7'):.3f}")
+    for k in range(1, 50):
+        now[0] = t0 + k * 0.2
+        reputation.record_path(["Drone7", "Drone8"], success=False)
+        reputation.record_path(["Drone8"], success=True)
+        if "Drone7" in reputation.avoided():
+            print(f"Drone7 below min_trust after {k} failed chains ({now[0] - t0:.1f} s): "
+                  f"{reputation.trust('Drone7'):.3f}; Drone8 (shared the blame) {reputation.trust('Drone8'):.3f}")
+            break
+    now[0] += 3 * 300.0
+    print(f"After three half-lives of silence, Drone7 trust recovers toward the prior: {reputation.trust('Drone7'):.3f}")
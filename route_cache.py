@@ -0,0 +1,131 @@
+# Route cache for the BitChat mesh.
+# Keeps recently selected routes per (source, destination) pair so repeated sends,
+# such as periodic telemetry to the base station, skip discovery and scoring.
+
+import time
+from collections import OrderedDict
+
+class RouteCache:
+    """TTL + LRU cache of selected routes keyed by endpoint pair.
+
+    Reverse indices from links and nodes to the entries whose paths use them let
+    a topology change invalidate exactly the affected routes instead of flushing
+    everything. Adding a link never invalidates: no cached path can use a link
+    that did not exist, and the TTL bounds how long a better new route is missed.
+    """
+    def __init__(self, ttl=30.0, max_entries=1024, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()   # (source, destination, variant) -> (expires_at, paths)
+        self._by_link = {}              # link key -> set of endpoint pairs
+        self._by_node = {}              # node ID -> set of endpoint pairs
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _link_key(u, v):
+        return (u, v) if str(u) <= str(v) else (v, u)
+
+    def get(self, source, destination, variant=None):
+        """Returns the cached paths for the pair, or None on a miss or expiry.
+
+        variant distinguishes selections for the same pair made with different
+        parameters, e.g. how many paths were asked for.
+        """
+        key = (source, destination, variant)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, paths = entry
+        if self.clock() >= expires_at:
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return paths
+
+    def put(self, source, destination, paths, variant=None):
+        """Caches the selected paths (lists of node IDs) for the pair."""
+        key = (source, destination, variant)
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (self.clock() + self.ttl, paths)
+        for path in paths:
+            for node_id in path:
+                self._by_node.setdefault(node_id, set()).add(key)
+            for u, v in zip(path, path[1:]):
+                self._by_link.setdefault(self._link_key(u, v), set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for path in entry[1]:
+            for node_id in path:
+                keys = self._by_node.get(node_id)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._by_node[node_id]
+            for u, v in zip(path, path[1:]):
+                link = self._link_key(u, v)
+                keys = self._by_link.get(link)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._by_link[link]
+
+    # --- Invalidation ---
+    def invalidate_link(self, u, v):
+        """Drops every entry with a path over the link. Returns the number dropped."""
+        return self._invalidate(self._by_link.get(self._link_key(u, v)))
+
+    def invalidate_node(self, node_id):
+        """Drops every entry with a path through (or to) the node. Returns the number dropped."""
+        return self._invalidate(self._by_node.get(node_id))
+
+    def invalidate_path(self, path):
+        """Drops every entry sharing a link with the path, e.g. after a failed delivery."""
+        return sum(self.invalidate_link(u, v) for u, v in zip(path, path[1:]))
+
+    def _invalidate(self, keys):
+        if not keys:
+            return 0
+        keys = list(keys)
+        for key in keys:
+            self._remove(key)
+        self.invalidations += len(keys)
+        return len(keys)
+
+    def clear(self):
+        self._entries.clear()
+        self._by_link.clear()
+        self._by_node.clear()
+
+    def on_topology_change(self, change, u, v):
+        """MeshTopology listener: register with topology.add_listener(cache.on_topology_change)."""
+        if change == "link_removed":
+            self.invalidate_link(u, v)
+        elif change == "node_isolated":
+            self.invalidate_node(u)
+
+    def __len__(self):
+        return len(self._entries)
+
+# Example Usage:
+if __name__ == "__main__":
+    cache = RouteCache(ttl=10.0, max_entries=2)
+    cache.put("Drone1", "BaseStation", [["Drone1", "Drone3", "BaseStation"]])
+    cache.put("Drone2", "BaseStation", [["Drone2", "Drone4", "BaseStation"]])
+
+    print(f"Hit: {cache.get('Drone1', 'BaseStation')}")
+    print(f"Removing link Drone4-BaseStation invalidated {cache.invalidate_link('BaseStation', 'Drone4')} route(s)")
+    print(f"Drone1 route still cached: {cache.get('Drone1', 'BaseStation') is not None}")
+    print(f"Isolating Drone3 invalidated {cache.invalidate_node('Drone3')} route(s)")
+    print(f"Hits: {cache.hits}, Misses: {cache.misses}, Invalidations: {cache.invalidations}")
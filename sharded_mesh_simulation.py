@@ -0,0 +1,224 @@
+# Multi-process sharded variant of the mesh relay simulation.
+# The topology is partitioned into shards, each shard's nodes are simulated in their
+# own process, and packets crossing shard boundaries are exchanged in batches at
+# synchronization barriers.
+
+import multiprocessing
+from collections import deque
+
+from mesh_event_simulator import EventScheduler, MeshRelaySimulator
+
+def partition_topology(topology, num_shards):
+    """Assigns every node to one of num_shards shards of (nearly) equal size.
+
+    Nodes are ordered breadth-first over the CSR export before being cut into
+    contiguous blocks, so neighbors tend to share a shard and few links cross
+    shard boundaries. Returns a dict node_id -> shard number.
+    """
+    indptr, indices = topology.to_csr()
+    num_nodes = len(indptr) - 1
+    visited = bytearray(num_nodes)
+    order = []
+    for root in range(num_nodes):
+        if visited[root]:
+            continue
+        visited[root] = 1
+        frontier = deque([root])
+        while frontier:
+            node = frontier.popleft()
+            order.append(node)
+            for neighbor in indices[indptr[node]:indptr[node + 1]]:
+                if not visited[neighbor]:
+                    visited[neighbor] = 1
+                    frontier.append(neighbor)
+
+    shard_size = -(-num_nodes // num_shards) if num_nodes else 1
+    return {topology.node_at(index): position // shard_size for position, index in enumerate(order)}
+
+class _ShardLinks:
+    """Minimal has_link view over the links leaving a shard's nodes."""
+    def __init__(self, links):
+        self._links = links
+
+    def has_link(self, u, v):
+        return (u, v) in self._links
+
+def _shard_worker(shard_id, shard_of, links, simulator_params, sends, conn):
+    """Runs one shard. Protocol with the coordinator over conn:
+
+    ("window", end, incoming) -> processes every local event before `end` after
+        accepting the incoming (arrival_time, record, hop) hand-overs, then replies
+        (outgoing {shard: [items]}, next local event time or None).
+    ("finish",) -> replies with the completed records and exits.
+    """
+    simulator = MeshRelaySimulator(_ShardLinks(links), scheduler=EventScheduler(), **simulator_params)
+    simulator.is_local = lambda node_id: shard_of[node_id] == shard_id
+    for message_index, path, at in sends:
+        simulator.send(path, at=at, message_index=message_index)
+    conn.send(simulator.scheduler.peek_time())
+
+    while True:
+        command = conn.recv()
+        if command[0] == "finish":
+            conn.send([(r.message_index, r.delivered_at, r.dropped_reason, r.dropped_at_hop)
+                       for r in simulator.completed])
+            conn.close()
+            return
+
+        _, window_end, incoming = command
+        for arrival_time, record, hop in incoming:
+            simulator.receive(arrival_time, record, hop)
+        simulator.run(until=window_end)
+
+        outgoing = {}
+        for item in simulator.outbox:
+            outgoing.setdefault(shard_of[item[1].path[item[2]]], []).append(item)
+        simulator.outbox = []
+        conn.send((outgoing, simulator.scheduler.peek_time()))
+
+class ShardedMeshSimulation:
+    """Runs the MeshRelaySimulator model across several processes.
+
+    Synchronization is conservative: a packet handed to another shard always
+    arrives at least link_delay after it was sent, so every shard can safely
+    process a window of link_delay simulated seconds before exchanging its
+    cross-shard packets. Windows with no events anywhere are skipped.
+
+    Because every random draw is keyed by (seed, message, hop) and simultaneous
+    events are ordered by (message, hop), a run produces the same per-message
+    results as a single MeshRelaySimulator with the same seed, regardless of
+    the number of shards. Relay callbacks (on_relay) and payloads are not
+    supported across processes; this mode simulates the transport only.
+    """
+    def __init__(self, topology, num_shards=None, **simulator_params):
+        if simulator_params.get("link_delay", 0.02) <= 0:
+            raise ValueError("Sharded simulation needs a positive link_delay as its lookahead.")
+        self.topology = topology
+        self.num_shards = num_shards or multiprocessing.cpu_count()
+        self.simulator_params = simulator_params
+        self.lookahead = simulator_params.get("link_delay", 0.02)
+        self._sends = []
+        self.windows = 0
+        self.cross_shard_packets = 0
+
+    def send(self, path, at=0.0):
+        """Queues a message along path (node IDs); returns its message index."""
+        message_index = len(self._sends)
+        self._sends.append((message_index, list(path), at))
+        return message_index
+
+    def run(self):
+        """Runs all queued messages; returns {message_index: (delivered_at, dropped_reason, dropped_at_hop)}."""
+        shard_of = partition_topology(self.topology, self.num_shards)
+        num_shards = max(shard_of.values(), default=0) + 1
+
+        shard_links = [set() for _ in range(num_shards)]
+        for u in self.topology.node_ids():
+            links = shard_links[shard_of[u]]
+            for v in self.topology.neighbors(u):
+                links.add((u, v))
+        shard_sends = [[] for _ in range(num_shards)]
+        for message_index, path, at in self._sends:
+            shard_sends[shard_of[path[0]]].append((message_index, path, at))
+
+        connections, processes = [], []
+        for shard_id in range(num_shards):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_shard_worker,
+                args=(shard_id, shard_of, shard_links[shard_id], self.simulator_params,
+                      shard_sends[shard_id], child_conn),
+                daemon=True
+            )
+            process.start()
+            connections.append(parent_conn)
+            processes.append(process)
+
+        next_times = [conn.recv() for conn in connections]
+        pending = [[] for _ in range(num_shards)]
+        while True:
+            candidates = [t for t in next_times if t is not None]
+            candidates.extend(item[0] for items in pending for item in items)
+            if not candidates:
+                break
+            window_end = min(candidates) + self.lookahead
+            for shard_id, conn in enumerate(connections):
+                conn.send(("window", window_end, pending[shard_id]))
+                pending[shard_id] = []
+            for shard_id, conn in enumerate(connections):
+                outgoing, next_times[shard_id] = conn.recv()
+                for target, items in outgoing.items():
+                    pending[target].extend(items)
+                    self.cross_shard_packets += len(items)
+            self.windows += 1
+
+        results = {}
+        for conn in connections:
+            conn.send(("finish",))
+            for message_index, delivered_at, dropped_reason, dropped_at_hop in conn.recv():
+                results[message_index] = (delivered_at, dropped_reason, dropped_at_hop)
+        for process in processes:
+            process.join()
+        return results
+
+def run_single_process(topology, sends, **simulator_params):
+    """Reference run of the same messages on one MeshRelaySimulator, in the same result format."""
+    simulator = MeshRelaySimulator(topology, **simulator_params)
+    for message_index, (path, at) in enumerate(sends):
+        simulator.send(path, at=at, message_index=message_index)
+    simulator.run()
+    return {r.message_index: (r.delivered_at, r.dropped_reason, r.dropped_at_hop) for r in simulator.completed}
+
+# Example Usage:
+if __name__ == "__main__":
+    import random
+    import sys
+    import time
+    from mesh_topology import MeshTopology
+    from path_discovery import KShortestPathsEngine
+
+    num_nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    num_shards = int(sys.argv[2]) if len(sys.argv) > 2 else min(8, multiprocessing.cpu_count())
+
+    # Grid-like swarm: drones on a lattice with links to their four neighbors.
+    random.seed(3)
+    side = int(num_nodes ** 0.5)
+    topology = MeshTopology()
+    for x in range(side):
+        for y in range(side):
+            topology.add_node((x, y))
+            if x:
+                topology.add_link((x, y), (x - 1, y))
+            if y:
+                topology.add_link((x, y), (x, y - 1))
+
+    # Each drone sends a few telemetry messages to its nearest of four ground stations.
+    engine = KShortestPathsEngine.for_topology(topology)
+    stations = [(side // 4, side // 4), (3 * side // 4, side // 4), (side // 4, 3 * side // 4), (3 * side // 4, 3 * side // 4)]
+    sends = []
+    for node_id in topology.node_ids():
+        station = min(stations, key=lambda s: abs(s[0] - node_id[0]) + abs(s[1] - node_id[1]))
+        path = engine.shortest_paths(node_id, station, k=1)[0]
+        for _ in range(3):
+            sends.append((path, random.uniform(0.0, 10.0)))
+
+    params = dict(link_delay=0.02, link_jitter=0.005, service_time=0.001, loss_rate=0.01, seed=99)
+
+    start = time.perf_counter()
+    reference = run_single_process(topology, sends, **params)
+    single_elapsed = time.perf_counter() - start
+
+    sharded = ShardedMeshSimulation(topology, num_shards=num_shards, **params)
+    for path, at in sends:
+        sharded.send(path, at=at)
+    start = time.perf_counter()
+    results = sharded.run()
+    sharded_elapsed = time.perf_counter() - start
+
+    delivered = sum(1 for r in results.values() if r[0] is not None)
+    print(f"--- {len(sends)} messages over a {len(topology)}-node swarm ---")
+    print(f"Single process: {single_elapsed:.2f} s")
+    print(f"{num_shards} shards: {sharded_elapsed:.2f} s ({sharded.windows} windows, "
+          f"{sharded.cross_shard_packets} cross-shard hand-overs)")
+    print(f"Delivered: {delivered}/{len(sends)}")
+    print(f"Identical to single-process run: {results == reference}")
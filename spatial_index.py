@@ -0,0 +1,208 @@
+# Position-based neighbor discovery for the BitChat mesh.
+# Drone positions and radio range determine which links exist. A uniform-grid
+# spatial index finds every in-range pair per tick without an all-pairs check.
+
+from itertools import product
+
+import numpy as np
+
+class RadioNeighborIndex:
+    """Uniform-grid index of drone positions with cells as wide as the radio range.
+
+    Any two drones in range lie in the same or adjacent cells, so only those cell
+    pairs are compared. Positions are binned and sorted once per call
+    (O(n log n)); candidate pairs and their distances are then evaluated with
+    NumPy in bulk.
+    """
+    def __init__(self, radio_range):
+        if radio_range <= 0:
+            raise ValueError("radio_range must be positive")
+        self.radio_range = radio_range
+        self._linked_codes = np.empty(0, dtype=np.int64)   # encoded pairs currently applied to a topology
+        self._linked_ids = ()   # node_ids the codes were encoded against (code = i * n + j)
+        self._topology = None   # topology the codes were applied to; its link removals are watched
+        self._removed_elsewhere = set()   # (u, v) links removed by someone else, e.g. isolate_node
+        self._applying = False
+
+    def neighbor_pairs(self, positions):
+        """Returns (i, j) index arrays, i < j, of every pair within radio range.
+
+        Args:
+            positions: Array of shape (n, d), d = 2 or 3, in the same unit as radio_range.
+        """
+        positions = np.asarray(positions, dtype=np.float64)
+        n, dims = positions.shape
+        if n < 2:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        # Cell coordinates start at 1 so that the -1 neighbor offsets stay non-negative.
+        cells = np.floor((positions - positions.min(axis=0)) / self.radio_range).astype(np.int64) + 1
+        extent = cells.max(axis=0) + 2
+        strides = np.ones(dims, dtype=np.int64)
+        for d in range(dims - 2, -1, -1):
+            strides[d] = strides[d + 1] * extent[d + 1]
+        keys = cells @ strides
+
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        unique_keys, starts, counts = np.unique(sorted_keys, return_index=True, return_counts=True)
+
+        range_sq = self.radio_range ** 2
+        pairs_i, pairs_j = [], []
+        for offset in self._half_neighborhood(dims):
+            target = keys + int(np.dot(offset, strides))
+            slot = np.searchsorted(unique_keys, target)
+            slot = np.minimum(slot, len(unique_keys) - 1)
+            found = unique_keys[slot] == target
+            if not found.any():
+                continue
+            sources = np.nonzero(found)[0]
+            cell_start = starts[slot[sources]]
+            cell_count = counts[slot[sources]]
+
+            # Expand each source against every member of its target cell.
+            total = int(cell_count.sum())
+            i = np.repeat(sources, cell_count)
+            group_offsets = np.arange(total) - np.repeat(np.cumsum(cell_count) - cell_count, cell_count)
+            j = order[np.repeat(cell_start, cell_count) + group_offsets]
+
+            if not any(offset):
+                keep = i < j   # same cell: each unordered pair once
+                i, j = i[keep], j[keep]
+            diff = positions[i] - positions[j]
+            within = np.einsum("ij,ij->i", diff, diff) <= range_sq
+            pairs_i.append(i[within])
+            pairs_j.append(j[within])
+
+        i = np.concatenate(pairs_i) if pairs_i else np.empty(0, dtype=np.int64)
+        j = np.concatenate(pairs_j) if pairs_j else np.empty(0, dtype=np.int64)
+        return np.minimum(i, j), np.maximum(i, j)
+
+    @staticmethod
+    def _half_neighborhood(dims):
+        """The zero offset plus one of each +/- pair of adjacent-cell offsets."""
+        offsets = [(0,) * dims]
+        for offset in product((-1, 0, 1), repeat=dims):
+            first_nonzero = next((c for c in offset if c != 0), 0)
+            if first_nonzero > 0:
+                offsets.append(offset)
+        return offsets
+
+    def apply_to_topology(self, topology, node_ids, positions):
+        """Brings the topology's links in line with the current positions.
+
+        Only links that appeared or disappeared since the previous call are
+        touched, so route caches and link-state routers see just the real changes.
+        Nodes may join, leave or be reordered between calls; links of a node that
+        left node_ids are removed. Returns (links_added, links_removed).
+        """
+        if topology is not self._topology:
+            if self._topology is not None:
+                self._topology.remove_listener(self._on_topology_change)
+            topology.add_listener(self._on_topology_change)
+            self._topology = topology
+            self._linked_codes = np.empty(0, dtype=np.int64)
+            self._linked_ids = ()
+            self._removed_elsewhere.clear()
+        node_ids = tuple(node_ids)
+        n = len(node_ids)
+        departed_links = 0
+        if node_ids != self._linked_ids:
+            departed_links = self._reencode(topology, node_ids)
+        if self._removed_elsewhere:
+            # Links dropped behind our back (isolate_node, another writer) are forgotten, so they
+            # go through the add path again: refused while a node is isolated, re-added after.
+            index = {node_id: k for k, node_id in enumerate(node_ids)}
+            gone = [min(index[u], index[v]) * n + max(index[u], index[v])
+                    for u, v in self._removed_elsewhere if u in index and v in index]
+            self._linked_codes = np.setdiff1d(self._linked_codes, np.asarray(gone, dtype=np.int64))
+            self._removed_elsewhere.clear()
+        i, j = self.neighbor_pairs(positions)
+        codes = np.unique(i * n + j)
+
+        removed = np.setdiff1d(self._linked_codes, codes, assume_unique=True)
+        added = np.setdiff1d(codes, self._linked_codes, assume_unique=True)
+
+        self._applying = True
+        try:
+            for code in removed.tolist():
+                topology.remove_link(node_ids[code // n], node_ids[code % n])
+            refused = []
+            for code in added.tolist():
+                u, v = node_ids[code // n], node_ids[code % n]
+                if not topology.add_link(u, v) and not topology.has_link(u, v):
+                    refused.append(code)   # e.g. an isolated node; retried on the next call
+        finally:
+            self._applying = False
+        self._linked_codes = np.setdiff1d(codes, np.asarray(refused, dtype=np.int64), assume_unique=True)
+        return len(added) - len(refused), len(removed) + departed_links
+
+    def _on_topology_change(self, change, u, v):
+        if change == "link_removed" and not self._applying:
+            self._removed_elsewhere.add((u, v))
+
+    def _reencode(self, topology, node_ids):
+        """Re-keys the applied links for a new node_ids; returns how many links of departed nodes were removed."""
+        old_ids, old_n = self._linked_ids, len(self._linked_ids)
+        index = {node_id: k for k, node_id in enumerate(node_ids)}
+        n = len(node_ids)
+        codes, departed = [], 0
+        for code in self._linked_codes.tolist():
+            u, v = old_ids[code // old_n], old_ids[code % old_n]
+            if u in index and v in index:
+                a, b = sorted((index[u], index[v]))
+                codes.append(a * n + b)
+            else:
+                self._applying = True
+                try:
+                    departed += topology.remove_link(u, v)
+                finally:
+                    self._applying = False
+        self._linked_codes = np.unique(np.asarray(codes, dtype=np.int64))
+        self._linked_ids = node_ids
+        return departed
+
+class SwarmMobilityModel:
+    """Drones moving at constant velocity inside a bounded area, bouncing off its edges."""
+    def __init__(self, num_drones, area_size, max_speed, dims=2, seed=None):
+        self.rng = np.random.default_rng(seed)
+        self.area_size = float(area_size)
+        self.positions = self.rng.uniform(0.0, self.area_size, (num_drones, dims))
+        self.velocities = self.rng.uniform(-max_speed, max_speed, (num_drones, dims))
+
+    def tick(self, dt):
+        """Advances every drone by dt seconds."""
+        self.positions += self.velocities * dt
+        low = self.positions < 0.0
+        high = self.positions > self.area_size
+        self.positions[low] = -self.positions[low]
+        self.positions[high] = 2 * self.area_size - self.positions[high]
+        self.velocities[low | high] *= -1
+        return self.positions
+
+# Example Usage:
+if __name__ == "__main__":
+    import time
+    from mesh_topology import MeshTopology
+
+    num_drones, area, radio_range = 5000, 10000.0, 300.0   # metres
+    swarm = SwarmMobilityModel(num_drones, area, max_speed=15.0, seed=1)
+    index = RadioNeighborIndex(radio_range)
+    topology = MeshTopology()
+    node_ids = [f"Drone{i}" for i in range(num_drones)]
+    for node_id in node_ids:
+        topology.add_node(node_id)
+
+    # Cross-check the grid against a brute-force all-pairs computation on a subset.
+    subset = swarm.positions[:800]
+    i, j = index.neighbor_pairs(subset)
+    diff = subset[:, None, :] - subset[None, :, :]
+    brute = np.argwhere(np.triu((diff ** 2).sum(axis=2) <= radio_range ** 2, k=1))
+    print(f"Grid matches brute force on 800 drones: {sorted(zip(i.tolist(), j.tolist())) == [tuple(p) for p in brute.tolist()]}")
+
+    for step in range(5):
+        start = time.perf_counter()
+        added, removed = index.apply_to_topology(topology, node_ids, swarm.positions)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"Tick {step}: {topology.link_count} links (+{added}/-{removed}) in {elapsed_ms:.1f} ms")
+        swarm.tick(1.0)